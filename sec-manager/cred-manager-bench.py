@@ -0,0 +1,313 @@
+# Credential Manager benchmarks
+#
+# Each subcommand runs in a scratch directory so it never touches the real
+# encryption.key, credentials.db or api_keys.txt.
+
+import argparse
+import asyncio
+import contextlib
+import importlib.util
+import os
+import random
+import statistics
+import string
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_cred_manager():
+    """Imports cred-manager.py (the hyphen keeps it from being imported normally)."""
+    spec = importlib.util.spec_from_file_location("cred_manager", os.path.join(HERE, "cred-manager.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def random_services(n, seed=42):
+    rng = random.Random(seed)
+    alphabet = string.ascii_lowercase + string.digits
+    return [f"svc-{i}-" + "".join(rng.choices(alphabet, k=8)) for i in range(n)]
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def report(name, n, seconds):
+    rate = n / seconds if seconds else float("inf")
+    print(f"{name:<28} {seconds * 1000:>10.1f} ms  {rate:>14,.0f} ops/sec")
+
+
+def bench_hash_table(args):
+    cm = load_cred_manager()
+    services = random_services(args.n)
+    lookups = services[:]
+    random.Random(7).shuffle(lookups)
+    value = ("hashed", b"encrypted")
+
+    print(f"Hash table benchmark: {args.n:,} services\n")
+
+    # Legacy list-of-lists table, with its per-call prints sent to /dev/null
+    if args.n <= args.legacy_limit:
+        legacy = cm.create_hash_table(10)
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            t_insert = timed(lambda: [cm.insert(legacy, s, value) for s in services])
+            t_search = timed(lambda: [cm.search(legacy, s) for s in lookups])
+        report("list-of-lists insert", args.n, t_insert)
+        report("list-of-lists search", args.n, t_search)
+    else:
+        print(f"list-of-lists skipped (n > --legacy-limit {args.legacy_limit})")
+
+    table = cm.HashTable()
+    report("HashTable insert", args.n, timed(lambda: [table.insert(s, value) for s in services]))
+    report("HashTable search", args.n, timed(lambda: [table.search(s) for s in lookups]))
+    report("HashTable delete", args.n, timed(lambda: [table.delete(s) for s in lookups]))
+
+    plain = {}
+
+    def dict_insert():
+        for s in services:
+            plain[s] = value
+
+    report("dict insert", args.n, timed(dict_insert))
+    report("dict search", args.n, timed(lambda: [plain.get(s) for s in lookups]))
+    report("dict delete", args.n, timed(lambda: [plain.pop(s, None) for s in lookups]))
+
+
+def seed_store(cm, services, db_path="credentials.db", filename="api_keys.txt"):
+    """Writes one encrypted key per service to both backends without the per-call prints."""
+    cm.init_db(db_path)
+    rows = [(s, cm.encrypt_api_key(f"key-{s}")) for s in services]
+    conn = cm.sqlite3.connect(db_path)
+    conn.executemany('INSERT OR REPLACE INTO api_keys (service, api_key_encrypted) VALUES (?, ?)', rows)
+    conn.commit()
+    conn.close()
+    with open(filename, "w") as file:
+        for service, encrypted_key in rows:
+            file.write(f"{service}:{cm.hash_api_key(service)}:{encrypted_key.decode()}\n")
+
+
+def bench_async(args):
+    cm = load_cred_manager()
+    services = random_services(args.services)
+    seed_store(cm, services)
+    rng = random.Random(3)
+    requests = [rng.choice(services) for _ in range(args.requests)]
+
+    print(f"Async load test: {args.requests:,} concurrent coroutines over {args.services:,} services, "
+          f"{args.workers} worker threads\n")
+
+    async def run(backend):
+        lines = []
+        async with cm.AsyncCredentialStore(backend, max_workers=args.workers) as store:
+            start = time.perf_counter()
+            results = await asyncio.gather(*(store.get(s) for s in requests))
+            lines.append((f"{backend} get()", len(requests), time.perf_counter() - start, store.fetches))
+            assert all(r == f"key-{s}" for r, s in zip(results, requests))
+
+            store.fetches = 0
+            start = time.perf_counter()
+            results = await store.get_many(requests)
+            lines.append((f"{backend} get_many()", len(requests), time.perf_counter() - start, store.fetches))
+            assert all(results[s] == f"key-{s}" for s in requests)
+
+            start = time.perf_counter()
+            await asyncio.gather(*(store.put(f"new-{i}", f"value-{i}") for i in range(args.puts)))
+            lines.append((f"{backend} put()", args.puts, time.perf_counter() - start, None))
+        return lines
+
+    for backend in ("sqlite", "file"):
+        # The backends print on every store; keep that out of the report
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            lines = asyncio.run(run(backend))
+        for name, n, seconds, fetches in lines:
+            report(name, n, seconds)
+            if fetches is not None:
+                print(f"{'':<28} {fetches:,} backend fetches for {n:,} requests")
+        print()
+
+
+def bench_rotation(args):
+    cm = load_cred_manager()
+    services = random_services(args.rows)
+    print(f"Key rotation benchmark: {args.rows:,} DB rows + {args.rows:,} file entries, "
+          f"batch size {args.batch_size}\n")
+    start = time.perf_counter()
+    seed_store(cm, services)
+    print(f"Seeded synthetic store in {time.perf_counter() - start:.2f}s\n")
+
+    for workers in args.workers:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            stats = cm.rotate_keys(batch_size=args.batch_size, workers=workers)
+        rows = stats["db_rows"] + stats["file_lines"]
+        print(f"workers={workers:<3} {rows:,} rows in {stats['seconds']:.2f}s "
+              f"({stats['rows_per_sec']:,.0f} rows/sec)")
+
+    # Everything must now decrypt with the newest key alone
+    from cryptography.fernet import Fernet
+    newest = Fernet(cm.load_key())
+    conn = cm.sqlite3.connect("credentials.db")
+    for service, token in conn.execute("SELECT service, api_key_encrypted FROM api_keys"):
+        assert newest.decrypt(token).decode() == f"key-{service}"
+    conn.close()
+    with open("api_keys.txt") as file:
+        for line in file:
+            service, _, token = line.strip().split(":")
+            assert newest.decrypt(token.encode()).decode() == f"key-{service}"
+    print("\nVerified every entry decrypts with the new primary key.")
+
+
+def bench_startup(args):
+    script = os.path.join(HERE, "cred-manager.py")
+    cm = load_cred_manager()
+    seed_store(cm, random_services(100))
+
+    def import_cmd(path):
+        return [sys.executable, "-c",
+                "import importlib.util as u, sys; s = u.spec_from_file_location('m', sys.argv[1]); "
+                "s.loader.exec_module(u.module_from_spec(s))", path]
+
+    cases = [
+        ("interpreter only", [sys.executable, "-c", "pass"]),
+        ("import cred-manager.py", import_cmd(script)),
+        ("cred-manager.py get", [sys.executable, script, "get", "svc-0-xxxxxxxx"]),
+        ("cred-manager.py list", [sys.executable, script, "list"]),
+    ]
+    if args.compare:
+        cases.append((f"import {os.path.basename(args.compare)}", import_cmd(os.path.abspath(args.compare))))
+
+    print(f"Startup benchmark: median of {args.runs} runs\n")
+    for name, cmd in cases:
+        samples = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+            samples.append(time.perf_counter() - start)
+        print(f"{name:<36} {statistics.median(samples) * 1000:>8.1f} ms")
+
+
+def latency_report(name, samples):
+    samples = sorted(samples)
+    p50 = samples[len(samples) // 2]
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    rate = len(samples) / sum(samples)
+    print(f"{name:<28} p50 {p50 * 1e6:>8.1f} us  p99 {p99 * 1e6:>8.1f} us  {rate:>12,.0f} ops/sec")
+
+
+def bench_daemon(args):
+    cm = load_cred_manager()
+    sys.path.insert(0, HERE)
+    from cred_client import CredentialClient
+
+    services = random_services(args.services)
+    seed_store(cm, services)
+    rng = random.Random(5)
+    lookups = [rng.choice(services) for _ in range(args.requests)]
+
+    print(f"Daemon benchmark: {args.requests:,} lookups over {args.services:,} services\n")
+
+    # Direct, in-process lookups: open SQLite and decrypt every time
+    samples = []
+    for service in lookups:
+        start = time.perf_counter()
+        cm.retrieve_api_key(service)
+        samples.append(time.perf_counter() - start)
+    latency_report("direct retrieve_api_key", samples)
+
+    daemon = subprocess.Popen([sys.executable, os.path.join(HERE, "cred-manager.py"), "serve",
+                               "--socket", "bench.sock", "--preload"], stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.time() + 10
+        while not os.path.exists("bench.sock"):
+            if time.time() > deadline or daemon.poll() is not None:
+                raise RuntimeError("Daemon did not start")
+            time.sleep(0.05)
+
+        with CredentialClient("bench.sock") as client:
+            client.get_many(services)  # Warm the cache even without --preload
+            samples = []
+            for service in lookups:
+                start = time.perf_counter()
+                client.get(service)
+                samples.append(time.perf_counter() - start)
+            latency_report("daemon get", samples)
+
+            start = time.perf_counter()
+            client.get_pipelined(lookups)
+            report("daemon pipelined get", len(lookups), time.perf_counter() - start)
+
+            start = time.perf_counter()
+            for i in range(0, len(lookups), args.batch):
+                client.get_many(lookups[i:i + args.batch])
+            report(f"daemon get_many (x{args.batch})", len(lookups), time.perf_counter() - start)
+
+        def worker(chunk):
+            with CredentialClient("bench.sock") as client:
+                for service in chunk:
+                    client.get(service)
+
+        chunks = [lookups[i::args.clients] for i in range(args.clients)]
+        threads = [threading.Thread(target=worker, args=(chunk,)) for chunk in chunks]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        report(f"daemon get, {args.clients} clients", len(lookups), time.perf_counter() - start)
+    finally:
+        daemon.terminate()
+        daemon.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Credential Manager benchmarks")
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    p = sub.add_parser("hash-table", help="In-memory hash table vs list-of-lists vs dict")
+    p.add_argument("--n", type=int, default=100000, help="Number of services (default: 100000)")
+    p.add_argument("--legacy-limit", type=int, default=20000,
+                   help="Skip the quadratic list-of-lists table above this size (default: 20000)")
+    p.set_defaults(func=bench_hash_table)
+
+    p = sub.add_parser("async", help="Load test for AsyncCredentialStore")
+    p.add_argument("--services", type=int, default=200, help="Services in the store (default: 200)")
+    p.add_argument("--requests", type=int, default=5000, help="Concurrent get() coroutines (default: 5000)")
+    p.add_argument("--puts", type=int, default=200, help="Concurrent put() coroutines (default: 200)")
+    p.add_argument("--workers", type=int, default=8, help="Executor threads (default: 8)")
+    p.set_defaults(func=bench_async)
+
+    p = sub.add_parser("rotation", help="Key rotation over a large synthetic store")
+    p.add_argument("--rows", type=int, default=100000, help="Rows per backend (default: 100000)")
+    p.add_argument("--batch-size", type=int, default=1000, help="Rows per committed batch (default: 1000)")
+    p.add_argument("--workers", type=int, nargs="+", default=sorted({1, os.cpu_count() or 1}),
+                   help="Worker process counts to try, one rotation each (default: 1 and the CPU count)")
+    p.set_defaults(func=bench_rotation)
+
+    p = sub.add_parser("startup", help="Process startup time for imports and one-shot commands")
+    p.add_argument("--runs", type=int, default=15, help="Runs per case (default: 15)")
+    p.add_argument("--compare", help="Another cred-manager.py to time the import of, e.g. an older version")
+    p.set_defaults(func=bench_startup)
+
+    p = sub.add_parser("daemon", help="Daemon over a Unix socket vs direct retrieve_api_key()")
+    p.add_argument("--services", type=int, default=1000, help="Services in the store (default: 1000)")
+    p.add_argument("--requests", type=int, default=5000, help="Lookups per case (default: 5000)")
+    p.add_argument("--batch", type=int, default=100, help="Services per get_many() call (default: 100)")
+    p.add_argument("--clients", type=int, default=8, help="Concurrent client connections (default: 8)")
+    p.set_defaults(func=bench_daemon)
+
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as scratch:
+        os.chdir(scratch)
+        args.func(args)
+
+
+if __name__ == "__main__":
+    main()
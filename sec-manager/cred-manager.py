@@ -1,25 +1,497 @@
 import sqlite3
-from cryptography.fernet import Fernet
 import os
+import sys
 import hashlib
+import threading
+import time
+import argparse
+import contextlib
+
+# asyncio, concurrent.futures and cryptography are imported where they are
+# first used, so one-shot CLI calls and plain imports do not pay for them.
 
 # Constants for storage options
 IN_MEMORY = 1
 FILE_STORAGE = 2
 
-# Load or generate key (store/load it securely in real use)
-def load_key():
+# Load or generate the keyring (store/load it securely in real use)
+# encryption.key holds one Fernet key per line, newest first. New data is
+# encrypted with the first key and any key in the ring can decrypt, so reads
+# keep working while a rotation is re-encrypting old rows.
+def load_keyring(key_path='encryption.key'):
     try:
-        with open('encryption.key', 'rb') as keyfile:
-            return keyfile.read()
+        with open(key_path, 'rb') as keyfile:
+            keys = [line.strip() for line in keyfile.read().splitlines() if line.strip()]
+        if keys:
+            return keys
     except FileNotFoundError:
-        key = Fernet.generate_key()
-        with open('encryption.key', 'wb') as keyfile:
-            keyfile.write(key)
-        return key
+        pass
+    from cryptography.fernet import Fernet
+    keys = [Fernet.generate_key()]
+    save_keyring(keys, key_path)
+    return keys
+
+def save_keyring(keys, key_path='encryption.key'):
+    """Atomically replaces the keyring file with keys (newest first)."""
+    tmp_path = key_path + '.tmp'
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'wb') as keyfile:
+        keyfile.write(b'\n'.join(keys) + b'\n')
+        keyfile.flush()
+        os.fsync(keyfile.fileno())
+    os.replace(tmp_path, key_path)
+
+def load_key(key_path='encryption.key'):
+    """Returns the primary (newest) key."""
+    return load_keyring(key_path)[0]
+
+def make_cipher(keys):
+    from cryptography.fernet import Fernet, MultiFernet
+    return MultiFernet([Fernet(key) for key in keys])
+
+
+class Keyring:
+    """The keys in a keyring file and the cipher built from them, loaded on first use."""
+
+    def __init__(self, key_path='encryption.key'):
+        self.key_path = key_path
+        self._keys = None
+        self._cipher = None
+        self._signature = None  # Identity of the keyring file the keys were read from
+        self._lock = threading.Lock()
+
+    def _file_signature(self):
+        try:
+            st = os.stat(self.key_path)
+        except FileNotFoundError:
+            return None
+        # save_keyring() replaces the file, so the inode changes on every rotation
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    @property
+    def keys(self):
+        if self._keys is None:
+            with self._lock:
+                if self._keys is None:
+                    signature = self._file_signature()
+                    self._keys = load_keyring(self.key_path)
+                    self._signature = signature or self._file_signature()
+        return self._keys
+
+    @property
+    def cipher(self):
+        if self._cipher is None:
+            keys = self.keys
+            with self._lock:
+                if self._cipher is None:
+                    self._cipher = make_cipher(keys)
+        return self._cipher
+
+    def replace(self, keys):
+        """Switches to keys, e.g. after a rotation wrote them to the keyring file."""
+        with self._lock:
+            self._keys = list(keys)
+            self._cipher = make_cipher(self._keys)
+            self._signature = self._file_signature()
+
+    def reload(self):
+        """Re-reads the keyring file. Returns True if the keys changed."""
+        signature = self._file_signature()
+        keys = load_keyring(self.key_path)
+        if keys == self._keys:
+            self._signature = signature
+            return False
+        self.replace(keys)
+        return True
+
+    def encrypt(self, data):
+        # If another process rotated, new data must go under its new primary key
+        if self._keys is not None:
+            signature = self._file_signature()
+            if signature is not None and signature != self._signature:
+                self.reload()
+        return self.cipher.encrypt(data)
+
+    def decrypt(self, token):
+        from cryptography.fernet import InvalidToken
+        try:
+            return self.cipher.decrypt(token)
+        except InvalidToken:
+            # Another process may have rotated the key since we loaded the keyring
+            if not self.reload():
+                raise
+            return self.cipher.decrypt(token)
+
+
+# Instrumentation
+# Every CredentialStore reports to a metrics object: operation latency per
+# backend (sqlite, file, hash, fernet, ...) and event counters such as cache
+# hits. The default NullMetrics does nothing; pass a Metrics instance, or any
+# object with the same observe/count/timer methods, to collect them.
+_NULL_TIMER = contextlib.nullcontext()
+
+
+class NullMetrics:
+    """Discards everything. Used when instrumentation is off."""
+
+    def observe(self, backend, operation, seconds):
+        pass
+
+    def count(self, backend, event, amount=1):
+        pass
+
+    def timer(self, backend, operation, call=False):
+        return _NULL_TIMER
+
+
+class Metrics:
+    """Latency histograms and counters, with optional cProfile/tracemalloc capture.
+
+    Operations timed with call=True are the public store/retrieve calls. When
+    profile is set they run under a shared cProfile profiler, and when
+    trace_memory is set their peak traced memory is recorded.
+    """
+
+    BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+               0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+    def __init__(self, buckets=None, profile=False, trace_memory=False):
+        self.buckets = tuple(buckets or self.BUCKETS)
+        self._lock = threading.Lock()
+        self._histograms = {}  # (backend, operation) -> [bucket counts..., +Inf count, sum, max]
+        self._counters = {}    # (backend, event) -> count
+        self._peak_memory = {}  # (backend, operation) -> bytes
+        self._local = threading.local()
+        self.profiler = None
+        if profile:
+            import cProfile
+            self.profiler = cProfile.Profile()
+        self.trace_memory = trace_memory
+        if trace_memory:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+
+    def observe(self, backend, operation, seconds):
+        key = (backend, operation)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [0] * (len(self.buckets) + 1) + [0.0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    hist[i] += 1
+                    break
+            else:
+                hist[len(self.buckets)] += 1
+            hist[-2] += seconds
+            if seconds > hist[-1]:
+                hist[-1] = seconds
+
+    def count(self, backend, event, amount=1):
+        key = (backend, event)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    @contextlib.contextmanager
+    def timer(self, backend, operation, call=False):
+        # Only the outermost call is profiled; cProfile cannot be enabled twice
+        outer = call and not getattr(self._local, "depth", 0)
+        if call:
+            self._local.depth = getattr(self._local, "depth", 0) + 1
+        if outer and self.trace_memory:
+            import tracemalloc
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        profiling = outer and self.profiler is not None and threading.current_thread() is threading.main_thread()
+        if profiling:
+            self.profiler.enable()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            if profiling:
+                self.profiler.disable()
+            if call:
+                self._local.depth -= 1
+            self.observe(backend, operation, elapsed)
+            if outer and self.trace_memory:
+                peak = tracemalloc.get_traced_memory()[1] - base
+                key = (backend, operation)
+                with self._lock:
+                    self._peak_memory[key] = max(self._peak_memory.get(key, 0), peak)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self._peak_memory.clear()
+
+    def snapshot(self):
+        """Returns all metrics as plain dicts and lists."""
+        with self._lock:
+            histograms = []
+            for (backend, operation), hist in sorted(self._histograms.items()):
+                total = sum(hist[:-2])
+                histograms.append({
+                    "backend": backend,
+                    "operation": operation,
+                    "count": total,
+                    "sum_seconds": hist[-2],
+                    "avg_seconds": hist[-2] / total if total else 0.0,
+                    "max_seconds": hist[-1],
+                    "buckets": {str(bound): n for bound, n in zip(self.buckets + ("+Inf",), hist[:-2])},
+                })
+            counters = [{"backend": b, "event": e, "count": n} for (b, e), n in sorted(self._counters.items())]
+            peaks = [{"backend": b, "operation": o, "bytes": n} for (b, o), n in sorted(self._peak_memory.items())]
+        return {"histograms": histograms, "counters": counters, "peak_memory": peaks}
+
+    def to_json(self):
+        import json
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self, prefix="credmgr"):
+        """Renders the metrics in the Prometheus text exposition format."""
+        snap = self.snapshot()
+        lines = [f"# HELP {prefix}_operation_seconds Latency of credential manager operations.",
+                 f"# TYPE {prefix}_operation_seconds histogram"]
+        for h in snap["histograms"]:
+            labels = f'backend="{h["backend"]}",operation="{h["operation"]}"'
+            cumulative = 0
+            for bound, n in h["buckets"].items():
+                cumulative += n
+                lines.append(f'{prefix}_operation_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{prefix}_operation_seconds_sum{{{labels}}} {h['sum_seconds']:.9f}")
+            lines.append(f"{prefix}_operation_seconds_count{{{labels}}} {h['count']}")
+        lines += [f"# HELP {prefix}_events_total Credential manager events such as cache hits and misses.",
+                  f"# TYPE {prefix}_events_total counter"]
+        for c in snap["counters"]:
+            lines.append(f'{prefix}_events_total{{backend="{c["backend"]}",event="{c["event"]}"}} {c["count"]}')
+        if snap["peak_memory"]:
+            lines += [f"# HELP {prefix}_peak_memory_bytes Peak traced memory of a single call.",
+                      f"# TYPE {prefix}_peak_memory_bytes gauge"]
+            for m in snap["peak_memory"]:
+                lines.append(f'{prefix}_peak_memory_bytes{{backend="{m["backend"]}",operation="{m["operation"]}"}} {m["bytes"]}')
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path, fmt="json"):
+        """Atomically writes the metrics to path as "json" or "prometheus" text."""
+        text = self.to_prometheus() if fmt == "prometheus" else self.to_json()
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+    def dump_profile(self, path):
+        """Writes the collected cProfile stats (readable with pstats)."""
+        if self.profiler is not None:
+            self.profiler.dump_stats(path)
+
+
+# Credential store
+# Holds the paths of one store plus its keyring. Nothing is read, generated or
+# created until the first call that needs it, and the methods never print, so
+# other tools can import and use it directly.
+class CredentialStore:
+    """SQLite and file credential storage that initializes key, cipher and schema lazily."""
+
+    def __init__(self, db_path='credentials.db', filename='api_keys.txt', key_path='encryption.key', keyring=None,
+                 metrics=None):
+        self.db_path = db_path
+        self.filename = filename
+        self.keyring = keyring if keyring is not None else Keyring(key_path)
+        self.metrics = metrics if metrics is not None else NullMetrics()
+        self._schema_ready = False
+
+    @property
+    def key_path(self):
+        return self.keyring.key_path
+
+    def with_paths(self, db_path=None, filename=None):
+        """Returns a store for other data files that shares this store's keyring and metrics."""
+        return CredentialStore(db_path or self.db_path, filename or self.filename, keyring=self.keyring,
+                               metrics=self.metrics)
+
+    def encrypt(self, api_key):
+        with self.metrics.timer("fernet", "encrypt"):
+            return self.keyring.encrypt(api_key.encode())
+
+    def decrypt(self, encrypted_key):
+        with self.metrics.timer("fernet", "decrypt"):
+            return self.keyring.decrypt(encrypted_key).decode()
+
+    def hash(self, api_key):
+        with self.metrics.timer("hash", "sha256"):
+            return hash_api_key(api_key)
+
+    def connect(self):
+        """Opens a connection, creating the schema on first use."""
+        if not self._schema_ready:
+            init_db(self.db_path)
+            self._schema_ready = True
+        return sqlite3.connect(self.db_path)
+
+    # SQLite backend
+    def put(self, service, api_key):
+        with self.metrics.timer("sqlite", "put", call=True):
+            enc_key = self.encrypt(api_key)
+            with self.metrics.timer("sqlite", "write"):
+                conn = self.connect()
+                try:
+                    conn.execute('''
+                        INSERT OR REPLACE INTO api_keys (service, api_key_encrypted)
+                        VALUES (?, ?)
+                    ''', (service, enc_key))
+                    conn.commit()
+                finally:
+                    conn.close()
+
+    def get(self, service):
+        """Returns the decrypted API key for service, or None."""
+        with self.metrics.timer("sqlite", "get", call=True):
+            with self.metrics.timer("sqlite", "query"):
+                conn = self.connect()
+                try:
+                    result = conn.execute('SELECT api_key_encrypted FROM api_keys WHERE service=?', (service,)).fetchone()
+                finally:
+                    conn.close()
+            self.metrics.count("sqlite", "hit" if result else "miss")
+            return self.decrypt(result[0]) if result else None
+
+    def get_many(self, services, chunk_size=500):
+        """Returns {service: api_key} for the services that are stored."""
+        with self.metrics.timer("sqlite", "get_many", call=True):
+            rows = []
+            with self.metrics.timer("sqlite", "query"):
+                conn = self.connect()
+                try:
+                    for i in range(0, len(services), chunk_size):
+                        chunk = services[i:i + chunk_size]
+                        placeholders = ",".join("?" * len(chunk))
+                        rows.extend(conn.execute(
+                            f'SELECT service, api_key_encrypted FROM api_keys WHERE service IN ({placeholders})', chunk))
+                finally:
+                    conn.close()
+            self.metrics.count("sqlite", "hit", len(rows))
+            self.metrics.count("sqlite", "miss", len(set(services)) - len(rows))
+            return {service: self.decrypt(encrypted_key) for service, encrypted_key in rows}
+
+    def list_services(self):
+        with self.metrics.timer("sqlite", "list", call=True):
+            conn = self.connect()
+            try:
+                return [row[0] for row in conn.execute('SELECT service FROM api_keys')]
+            finally:
+                conn.close()
+
+    # File backend
+    def put_file(self, service, api_key):
+        with self.metrics.timer("file", "put", call=True):
+            hashed_key = self.hash(api_key)
+            encrypted_key = self.encrypt(api_key)
+            with self.metrics.timer("file", "append"):
+                with open(self.filename, "a") as file:  # Open in append mode
+                    file.write(f"{service}:{hashed_key}:{encrypted_key.decode()}\n")
+
+    def get_file(self, service):
+        """Returns the decrypted API key for service from the file, or None.
 
-ENCRYPTION_KEY = load_key()
-CIPHER = Fernet(ENCRYPTION_KEY)
+        Raises FileNotFoundError if the file does not exist.
+        """
+        with self.metrics.timer("file", "get", call=True):
+            return self._scan_file([service]).get(service)
+
+    def get_many_file(self, services):
+        """Returns {service: api_key} for the services found in one pass over the file."""
+        with self.metrics.timer("file", "get_many", call=True):
+            return self._scan_file(services)
+
+    def _scan_file(self, services):
+        wanted = set(services)
+        tokens = {}
+        with self.metrics.timer("file", "scan"):
+            with open(self.filename, "r") as file:
+                for line in file:
+                    parts = line.strip().split(":")
+                    # The first entry for a service wins
+                    if len(parts) == 3 and parts[0] in wanted and parts[0] not in tokens:
+                        tokens[parts[0]] = parts[2]
+                        if len(tokens) == len(wanted):
+                            break
+        self.metrics.count("file", "hit", len(tokens))
+        self.metrics.count("file", "miss", len(wanted) - len(tokens))
+        return {service: self.decrypt(token.encode()) for service, token in tokens.items()}
+
+    def list_file_services(self):
+        with self.metrics.timer("file", "list", call=True):
+            services = {}
+            with open(self.filename, "r") as file:
+                for line in file:
+                    parts = line.strip().split(":")
+                    if len(parts) == 3:
+                        services[parts[0]] = None
+            return list(services)
+
+    # Key rotation (see rotate_keys() below)
+    def rotate_keys(self, batch_size=None, workers=None):
+        return _rotate_store(self, batch_size or ROTATION_BATCH_SIZE, workers)
+
+    def retire_old_keys(self):
+        """Drops every key but the primary and returns how many were dropped.
+
+        Raises RuntimeError, and changes nothing, while a rotation is unfinished
+        or while any stored token cannot be decrypted with the primary key alone.
+        """
+        keys = load_keyring(self.key_path)
+        if len(keys) == 1:
+            return 0
+        conn = self.connect()
+        try:
+            _init_rotation_table(conn)
+            if conn.execute('SELECT 1 FROM key_rotation WHERE NOT (db_done AND file_done)').fetchone():
+                raise RuntimeError("A key rotation is unfinished; run rotate_keys() again to complete it first")
+            stale = _count_stale_tokens(conn, self.filename, keys[0])
+        finally:
+            conn.close()
+        if stale:
+            raise RuntimeError(f"{stale} stored key(s) cannot be decrypted with the primary key; "
+                               f"run rotate_keys() first")
+        save_keyring(keys[:1], self.key_path)
+        self.keyring.replace(keys[:1])
+        return len(keys) - 1
+
+
+# Default store used by the module-level functions below
+STORE = CredentialStore()
+
+# The module-level functions print a line for every call, as the menu expects.
+# Set VERBOSE to False (or pass --quiet) to silence them.
+VERBOSE = True
+
+def _say(message):
+    if VERBOSE:
+        print(message)
+
+def set_metrics(metrics):
+    """Installs a metrics collector on the default store and returns it."""
+    STORE.metrics = metrics
+    return metrics
+
+def _store_for(db_path=None, filename=None):
+    if db_path in (None, STORE.db_path) and filename in (None, STORE.filename):
+        return STORE
+    return STORE.with_paths(db_path, filename)
+
+def __getattr__(name):
+    # These used to be built when the module was imported; now they load on first access
+    if name == 'KEYRING':
+        return STORE.keyring.keys
+    if name == 'ENCRYPTION_KEY':
+        return STORE.keyring.keys[0]
+    if name == 'CIPHER':
+        return STORE.keyring.cipher
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # SQLite DB setup
 def init_db(db_path='credentials.db'):
@@ -44,93 +516,67 @@ def hash_api_key(api_key):
 # Function to encrypt the API key
 def encrypt_api_key(api_key):
     """Encrypts the API key using Fernet."""
-    encrypted_key = CIPHER.encrypt(api_key.encode())
-    return encrypted_key
+    return STORE.encrypt(api_key)
 
 # Function to decrypt the API key
 def decrypt_api_key(encrypted_key):
     """Decrypts the API key using Fernet."""
-    decrypted_key = CIPHER.decrypt(encrypted_key).decode()
-    return decrypted_key
+    return STORE.decrypt(encrypted_key)
 
 def store_api_key(service, api_key, db_path='credentials.db'):
-    enc_key = CIPHER.encrypt(api_key.encode())
-    conn = sqlite3.connect(db_path)
-    c = conn.cursor()
-    c.execute('''
-        INSERT OR REPLACE INTO api_keys (service, api_key_encrypted)
-        VALUES (?, ?)
-    ''', (service, enc_key))
-    conn.commit()
-    conn.close()
-    print(f"API key for {service} securely stored in DB.")
+    _store_for(db_path).put(service, api_key)
+    _say(f"API key for {service} securely stored in DB.")
 
 # Function to store credentials in memory
 def store_in_memory(hash_table, service_name, api_key):
     """Stores the service name and encrypted API key in memory."""
-    hashed_key = hash_api_key(api_key)
-    encrypted_key = encrypt_api_key(api_key)
-    # Using service_name as key and encrypted API key as value
-    insert(hash_table, service_name, (hashed_key, encrypted_key))
-    print(f"API key for {service_name} stored in memory (encrypted).")
+    with STORE.metrics.timer("memory", "put", call=True):
+        hashed_key = STORE.hash(api_key)
+        encrypted_key = encrypt_api_key(api_key)
+        # Using service_name as key and encrypted API key as value
+        hash_table.insert(service_name, (hashed_key, encrypted_key))
+    _say(f"API key for {service_name} stored in memory (encrypted).")
 
 # Function to store credentials in a file
 def store_in_file(filename, service_name, api_key):
     """Stores the service name and encrypted API key in a file."""
-    hashed_key = hash_api_key(api_key)
-    encrypted_key = encrypt_api_key(api_key)
     try:
-        with open(filename, "a") as file:  # Open in append mode
-            file.write(f"{service_name}:{hashed_key}:{encrypted_key.decode()}\n")
-        print(f"API key for {service_name} stored in file (encrypted).")
+        _store_for(filename=filename).put_file(service_name, api_key)
+        _say(f"API key for {service_name} stored in file (encrypted).")
     except Exception as e:
         print(f"Error storing in file: {e}")
 
 def retrieve_api_key(service, db_path='credentials.db'):
-    conn = sqlite3.connect(db_path)
-    c = conn.cursor()
-    c.execute('SELECT api_key_encrypted FROM api_keys WHERE service=?', (service,))
-    result = c.fetchone()
-    conn.close()
-    if result:
-        return CIPHER.decrypt(result[0]).decode()
-    else:
-        print(f"No API key found for {service}.")
-        return None
+    api_key = _store_for(db_path).get(service)
+    if api_key is None:
+        _say(f"No API key found for {service}.")
+    return api_key
 
 # Function to retrieve credentials from memory
 def retrieve_from_memory(hash_table, service_name):
     """Retrieves the encrypted API key from memory and returns it."""
-    result = search(hash_table, service_name)
+    with STORE.metrics.timer("memory", "get", call=True):
+        result = hash_table.search(service_name)
+        decrypted_key = decrypt_api_key(result[1]) if result else None
     if result:
-        hashed_key, encrypted_key = result
-        decrypted_key = decrypt_api_key(encrypted_key)
-        print(f"API key (decrypted) for {service_name} retrieved from memory.")
+        _say(f"API key (decrypted) for {service_name} retrieved from memory.")
         return decrypted_key
     else:
-        print(f"No API key found for {service_name} in memory.")
+        _say(f"No API key found for {service_name} in memory.")
         return None
 
 # Function to retrieve credentials from a file
 def retrieve_from_file(filename, service_name):
     """Retrieves the encrypted API key from a file and returns it."""
     try:
-        with open(filename, "r") as file:
-            for line in file:
-                parts = line.strip().split(":")
-                if len(parts) == 3:
-                    s_name, hashed_key, encrypted_key_str = parts
-                    if s_name == service_name:
-                        encrypted_key = encrypted_key_str.encode()
-                        decrypted_key = decrypt_api_key(encrypted_key)
-                        print(f"API key (decrypted) for {service_name} retrieved from file.")
-                        return decrypted_key
-                else:
-                    print(f"Invalid format in file: {line.strip()}")
-        print(f"No API key found for {service_name} in file.")
+        decrypted_key = _store_for(filename=filename).get_file(service_name)
+        if decrypted_key is not None:
+            _say(f"API key (decrypted) for {service_name} retrieved from file.")
+            return decrypted_key
+        _say(f"No API key found for {service_name} in file.")
         return None
     except FileNotFoundError:
-        print("File not found.")
+        _say("File not found.")
         return None
     except Exception as e:
         print(f"Error retrieving from file: {e}")
@@ -144,14 +590,10 @@ def list_available_keys(hash_table, filename, db_path='credentials.db'):
     # List keys stored in SQLite DB
     print("\nIn SQLite DB:")
     try:
-        conn = sqlite3.connect(db_path)
-        c = conn.cursor()
-        c.execute('SELECT service FROM api_keys')
-        services = c.fetchall()
-        conn.close()
+        services = _store_for(db_path).list_services()
         if services:
             for service in services:
-                print(f"- {service[0]}")
+                print(f"- {service}")
         else:
             print("No keys stored in SQLite DB.")
     except sqlite3.Error as e:
@@ -160,27 +602,20 @@ def list_available_keys(hash_table, filename, db_path='credentials.db'):
     # List keys stored in memory
     print("\nIn Memory:")
     if hash_table:
-        for bucket in hash_table:
-            for pair in bucket:
-                print(f"- {pair[0]}")
+        for service in hash_table:
+            print(f"- {service}")
     else:
         print("No keys stored in memory.")
 
     # List keys stored in file
     print("\nIn File:")
     try:
-        with open(filename, "r") as file:
-            services = set()
-            for line in file:
-                parts = line.strip().split(":")
-                if len(parts) == 3:
-                    s_name, _, _ = parts
-                    services.add(s_name)
-            if services:
-                for service in services:
-                    print(f"- {service}")
-            else:
-                print("No keys stored in file.")
+        services = _store_for(filename=filename).list_file_services()
+        if services:
+            for service in services:
+                print(f"- {service}")
+        else:
+            print("No keys stored in file.")
     except FileNotFoundError:
         print("File not found.")
     except Exception as e:
@@ -223,17 +658,660 @@ def search(hash_table, key):
     print("Key not found")
     return None
 
-# Main function to interact with the user
-def main():
-    """Main function to interact with the user."""
-    hash_table = create_hash_table(10)
-    filename = "api_keys.txt"
 
-    # Store the encryption key in a file (INSECURE - for demonstration purposes only)
-    with open("encryption.key", "wb") as key_file:
-        key_file.write(ENCRYPTION_KEY)
+# Step 5: Open-addressing hash table that grows with its contents
+# The list-of-lists table above never resizes, so chains get longer as more
+# services are stored. This table keeps its slots in flat arrays, uses
+# robin-hood probing to keep probe sequences short and doubles in size once
+# the load factor passes max_load.
+class HashTable:
+    """Array-backed hash table with robin-hood probing and automatic resizing."""
+
+    def __init__(self, capacity=8, max_load=0.75):
+        if not 0 < max_load < 1:
+            raise ValueError("max_load must be between 0 and 1")
+        size = 8
+        while size < capacity:
+            size *= 2
+        self.max_load = max_load
+        self._count = 0
+        self._allocate(size)
+
+    def _allocate(self, size):
+        self._mask = size - 1
+        self._limit = int(size * self.max_load)
+        self._keys = [None] * size
+        self._values = [None] * size
+        self._hashes = [0] * size
+        self._dists = [-1] * size  # Probe distance from the home slot, -1 marks an empty slot
+
+    def _resize(self, size):
+        old = [(self._hashes[i], self._keys[i], self._values[i])
+               for i, dist in enumerate(self._dists) if dist >= 0]
+        self._allocate(size)
+        self._count = 0
+        for h, key, value in old:
+            self._place(h, key, value)
+
+    def _place(self, h, key, value):
+        """Inserts an entry known not to be in the table."""
+        keys, values, hashes, dists = self._keys, self._values, self._hashes, self._dists
+        mask = self._mask
+        index = h & mask
+        dist = 0
+        while True:
+            slot_dist = dists[index]
+            if slot_dist < 0:
+                keys[index], values[index], hashes[index], dists[index] = key, value, h, dist
+                self._count += 1
+                return
+            if slot_dist < dist:
+                # Robin hood: the resident is closer to home than we are, so it gives up its slot
+                keys[index], key = key, keys[index]
+                values[index], value = value, values[index]
+                hashes[index], h = h, hashes[index]
+                dists[index], dist = dist, slot_dist
+            index = (index + 1) & mask
+            dist += 1
+
+    def _find(self, key):
+        """Returns the slot holding key, or -1 if it is not stored."""
+        h = hash(key)
+        keys, hashes, dists = self._keys, self._hashes, self._dists
+        mask = self._mask
+        index = h & mask
+        dist = 0
+        while True:
+            slot_dist = dists[index]
+            # An empty slot, or one poorer than our probe distance, ends the search
+            if slot_dist < dist:
+                return -1
+            if hashes[index] == h and keys[index] == key:
+                return index
+            index = (index + 1) & mask
+            dist += 1
+
+    def insert(self, key, value):
+        """Stores value under key, replacing any existing value."""
+        index = self._find(key)
+        if index >= 0:
+            self._values[index] = value
+            return
+        if self._count >= self._limit:
+            self._resize((self._mask + 1) * 2)
+        self._place(hash(key), key, value)
+
+    def search(self, key, default=None):
+        """Returns the value stored under key, or default if it is missing."""
+        index = self._find(key)
+        if index < 0:
+            return default
+        return self._values[index]
+
+    def delete(self, key):
+        """Removes key from the table. Returns True if it was present."""
+        index = self._find(key)
+        if index < 0:
+            return False
+        keys, values, hashes, dists = self._keys, self._values, self._hashes, self._dists
+        mask = self._mask
+        # Backward-shift deletion: pull the following displaced entries one slot closer to home
+        nxt = (index + 1) & mask
+        while dists[nxt] > 0:
+            keys[index], values[index], hashes[index] = keys[nxt], values[nxt], hashes[nxt]
+            dists[index] = dists[nxt] - 1
+            index = nxt
+            nxt = (nxt + 1) & mask
+        keys[index], values[index], hashes[index], dists[index] = None, None, 0, -1
+        self._count -= 1
+        return True
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, key):
+        return self._find(key) >= 0
+
+    def __iter__(self):
+        for i, dist in enumerate(self._dists):
+            if dist >= 0:
+                yield self._keys[i]
+
+    def items(self):
+        """Yields (key, value) pairs in slot order."""
+        for i, dist in enumerate(self._dists):
+            if dist >= 0:
+                yield self._keys[i], self._values[i]
+
+    def capacity(self):
+        """Returns the number of slots currently allocated."""
+        return self._mask + 1
 
-    init_db()
+# Asyncio-facing API over the SQLite and file backends
+class AsyncCredentialStore:
+    """Async get/put/get_many over the SQLite or file backend.
+
+    SQLite, file I/O and Fernet work run on a bounded thread pool so the event
+    loop never blocks, and concurrent requests for the same service share a
+    single fetch and decrypt.
+    """
+
+    def __init__(self, backend="sqlite", db_path='credentials.db', filename="api_keys.txt", max_workers=8, store=None):
+        from concurrent.futures import ThreadPoolExecutor
+        if backend not in ("sqlite", "file"):
+            raise ValueError(f"Unknown backend: {backend}")
+        self.backend = backend
+        self.store = store if store is not None else _store_for(db_path, filename)
+        self.fetches = 0  # Number of backend reads actually performed
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="cred-store")
+        self._inflight = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Shuts down the worker threads."""
+        self._executor.shutdown(wait=True)
+
+    # Blocking helpers, always run on the executor
+    def _fetch_one(self, service):
+        self.fetches += 1
+        if self.backend == "sqlite":
+            return self.store.get(service)
+        try:
+            return self.store.get_file(service)
+        except FileNotFoundError:
+            return None
+
+    def _fetch_many(self, services):
+        self.fetches += 1
+        if self.backend == "sqlite":
+            return self.store.get_many(services)
+        try:
+            return self.store.get_many_file(services)
+        except FileNotFoundError:
+            return {}
+
+    def _put(self, service, api_key):
+        if self.backend == "sqlite":
+            self.store.put(service, api_key)
+        else:
+            self.store.put_file(service, api_key)
+
+    def _track(self, service, future):
+        self._inflight[service] = future
+
+        def _done(f, service=service):
+            if self._inflight.get(service) is f:
+                del self._inflight[service]
+
+        future.add_done_callback(_done)
+
+    async def get(self, service):
+        """Returns the decrypted API key for service, or None if it is not stored."""
+        import asyncio
+        future = self._inflight.get(service)
+        if future is not None:
+            self.store.metrics.count("async", "coalesced")
+        else:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self._executor, self._fetch_one, service)
+            self._track(service, future)
+        # Shield so a cancelled caller does not cancel the fetch other callers share
+        return await asyncio.shield(future)
+
+    async def get_many(self, services):
+        """Returns {service: api_key or None}, reading all missing services in one batch."""
+        import asyncio
+        loop = asyncio.get_running_loop()
+        services = list(dict.fromkeys(services))
+        waiting = {s: self._inflight[s] for s in services if s in self._inflight}
+        if waiting:
+            self.store.metrics.count("async", "coalesced", len(waiting))
+        missing = [s for s in services if s not in waiting]
+        if missing:
+            batch = loop.run_in_executor(self._executor, self._fetch_many, missing)
+            for service in missing:
+                future = loop.create_future()
+                self._track(service, future)
+                waiting[service] = future
+
+            def _fan_out(b, missing=missing):
+                for service in missing:
+                    future = waiting[service]
+                    if future.done():
+                        continue
+                    if b.cancelled():
+                        future.cancel()
+                    elif b.exception() is not None:
+                        future.set_exception(b.exception())
+                    else:
+                        future.set_result(b.result().get(service))
+
+            batch.add_done_callback(_fan_out)
+        results = await asyncio.gather(*(asyncio.shield(waiting[s]) for s in services))
+        return dict(zip(services, results))
+
+    async def put(self, service, api_key):
+        """Encrypts and stores api_key for service."""
+        import asyncio
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._put, service, api_key)
+        # Reads started before the write may return the old key; later ones must not join them
+        self._inflight.pop(service, None)
+
+
+# Credential daemon
+# A long-running process that keeps decrypted keys for hot services in memory
+# and answers get/put/list requests from local processes over a Unix socket,
+# so they do not each open SQLite and decrypt. The wire protocol and the
+# client live in cred_client.py.
+class CredentialDaemon:
+    """Serves a CredentialStore to local clients over a Unix domain socket."""
+
+    def __init__(self, store, socket_path='cred-manager.sock', backend="sqlite", cache_size=10000, max_workers=8):
+        from collections import OrderedDict
+        self.store = store
+        self.socket_path = socket_path
+        self.backend = backend
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # service -> decrypted key, least recently used first
+        self._generation = {}        # service -> number of puts, so a read that raced a put is not cached
+        self._clients = {}           # connection task -> writer, so shutdown can hang up on clients
+        self._async_store = AsyncCredentialStore(backend, max_workers=max_workers, store=store)
+
+    def _remember(self, service, api_key):
+        self._cache[service] = api_key
+        self._cache.move_to_end(service)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def get(self, service):
+        api_key = self._cache.get(service)
+        if api_key is not None:
+            self._cache.move_to_end(service)
+            self.store.metrics.count("daemon", "cache_hit")
+            return api_key
+        self.store.metrics.count("daemon", "cache_miss")
+        generation = self._generation.get(service, 0)
+        api_key = await self._async_store.get(service)
+        if api_key is not None and self._generation.get(service, 0) == generation:
+            self._remember(service, api_key)
+        return api_key
+
+    async def get_many(self, services):
+        results = {s: self._cache.get(s) for s in services}
+        missing = [s for s, api_key in results.items() if api_key is None]
+        self.store.metrics.count("daemon", "cache_hit", len(results) - len(missing))
+        self.store.metrics.count("daemon", "cache_miss", len(missing))
+        if missing:
+            generations = {s: self._generation.get(s, 0) for s in missing}
+            for service, api_key in (await self._async_store.get_many(missing)).items():
+                if api_key is not None and self._generation.get(service, 0) == generations[service]:
+                    self._remember(service, api_key)
+                results[service] = api_key
+        return [results[s] for s in services]
+
+    async def put(self, service, api_key):
+        await self._async_store.put(service, api_key)
+        # Reads that were already fetching may return the old key: they must not cache it
+        self._generation[service] = self._generation.get(service, 0) + 1
+        self._remember(service, api_key)
+
+    async def list(self):
+        import asyncio
+        lister = self.store.list_services if self.backend == "sqlite" else self.store.list_file_services
+        try:
+            return await asyncio.get_running_loop().run_in_executor(None, lister)
+        except FileNotFoundError:
+            return []
+
+    async def preload(self):
+        """Decrypts every stored key into the cache, up to cache_size."""
+        services = (await self.list())[:self.cache_size]
+        await self.get_many(services)
+        return len(services)
+
+    async def _handle(self, body):
+        import struct
+        from cred_client import (decode_body, encode_frame, OP_GET, OP_PUT, OP_LIST, OP_GET_MANY,
+                                 STATUS_OK, STATUS_NOT_FOUND, STATUS_ERROR)
+        try:
+            op, fields = decode_body(body)
+        except (struct.error, UnicodeDecodeError):
+            return encode_frame(STATUS_ERROR, ["Malformed request"])
+        try:
+            if op == OP_GET and len(fields) == 1:
+                api_key = await self.get(fields[0])
+                if api_key is None:
+                    return encode_frame(STATUS_NOT_FOUND)
+                return encode_frame(STATUS_OK, [api_key])
+            if op == OP_PUT and len(fields) == 2:
+                await self.put(fields[0], fields[1])
+                return encode_frame(STATUS_OK)
+            if op == OP_LIST and not fields:
+                return encode_frame(STATUS_OK, await self.list())
+            if op == OP_GET_MANY:
+                return encode_frame(STATUS_OK, await self.get_many(fields))
+            return encode_frame(STATUS_ERROR, [f"Bad request: {op!r} with {len(fields)} field(s)"])
+        except Exception as e:
+            return encode_frame(STATUS_ERROR, [str(e)])
+
+    async def _serve_client(self, reader, writer):
+        import asyncio
+        import struct
+        from cred_client import encode_frame, MAX_FRAME, STATUS_ERROR
+
+        self._clients[asyncio.current_task()] = writer
+        # Requests are handled concurrently but answered in the order they arrived
+        pending = asyncio.Queue(maxsize=1024)
+
+        async def respond():
+            while True:
+                task = await pending.get()
+                if task is None:
+                    return
+                writer.write(await task)
+                if pending.empty():
+                    await writer.drain()
+
+        responder = asyncio.create_task(respond())
+        try:
+            while True:
+                header = await reader.readexactly(4)
+                (length,) = struct.unpack("!I", header)
+                if length == 0 or length > MAX_FRAME:
+                    # The stream cannot be resynchronized: answer after the queued replies, then hang up
+                    error = asyncio.get_running_loop().create_future()
+                    error.set_result(encode_frame(STATUS_ERROR, ["Bad frame length"]))
+                    await pending.put(error)
+                    break
+                body = await reader.readexactly(length)
+                await pending.put(asyncio.create_task(self._handle(body)))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            await pending.put(None)
+            try:
+                await responder
+                await writer.drain()
+            except ConnectionError:
+                pass
+            writer.close()
+            self._clients.pop(asyncio.current_task(), None)
+
+    async def _dump_metrics(self, dump, interval):
+        import asyncio
+        while True:
+            await asyncio.sleep(interval)
+            dump()
+
+    async def serve_forever(self, preload=False, dump_metrics=None, metrics_interval=10.0):
+        """Serves until SIGINT or SIGTERM, then removes the socket.
+
+        If dump_metrics is given it is called every metrics_interval seconds.
+        """
+        import asyncio
+        import signal
+        import socket
+        if os.path.exists(self.socket_path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.socket_path)
+                raise RuntimeError(f"A daemon is already listening on {self.socket_path}")
+            except (ConnectionRefusedError, FileNotFoundError):
+                os.unlink(self.socket_path)  # Left behind by a daemon that did not shut down cleanly
+            finally:
+                probe.close()
+
+        # Only the owner may connect: the socket hands out decrypted keys
+        old_umask = os.umask(0o177)
+        try:
+            server = await asyncio.start_unix_server(self._serve_client, path=self.socket_path)
+        finally:
+            os.umask(old_umask)
+
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        try:
+            if preload:
+                print(f"Preloaded {await self.preload()} key(s).", file=sys.stderr)
+            print(f"Serving {self.backend} credentials on {self.socket_path}", file=sys.stderr)
+            dumper = None
+            if dump_metrics is not None:
+                dumper = asyncio.create_task(self._dump_metrics(dump_metrics, metrics_interval))
+            async with server:
+                await stop.wait()
+                # Hang up on connected clients so their handlers finish before the event loop shuts down
+                for writer in list(self._clients.values()):
+                    writer.close()
+                if self._clients:
+                    await asyncio.wait(list(self._clients), timeout=5)
+            if dumper is not None:
+                dumper.cancel()
+        finally:
+            self._async_store.close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+
+# Key rotation
+# rotate_keys() puts a new key at the front of the keyring, then streams
+# through the api_keys table and the key file in batches and re-encrypts
+# each token under the new key. Progress is committed with every batch, so an
+# interrupted rotation picks up where it stopped the next time it is run.
+ROTATION_BATCH_SIZE = 1000
+
+_worker_ciphers = {}
+
+def _rotate_tokens(keys, tokens):
+    """Re-encrypts tokens under keys[0]. Runs in a worker process."""
+    cipher = _worker_ciphers.get(keys)
+    if cipher is None:
+        cipher = _worker_ciphers[keys] = make_cipher(keys)
+    return [cipher.rotate(token) for token in tokens]
+
+def _rotate_batch(pool, workers, keys, tokens):
+    if pool is None or len(tokens) < 2 * workers:
+        return _rotate_tokens(keys, tokens)
+    size = -(-len(tokens) // workers)
+    chunks = [tokens[i:i + size] for i in range(0, len(tokens), size)]
+    rotated = []
+    for part in pool.map(_rotate_tokens, [keys] * len(chunks), chunks):
+        rotated.extend(part)
+    return rotated
+
+def _key_id(key):
+    return hashlib.sha256(key).hexdigest()[:16]
+
+def _count_stale_tokens(conn, filename, primary):
+    """Counts DB and file tokens that the primary key alone cannot decrypt."""
+    from cryptography.fernet import Fernet, InvalidToken
+    cipher = Fernet(primary)
+
+    def stale(token):
+        try:
+            cipher.decrypt(token)
+            return False
+        except InvalidToken:
+            return True
+
+    count = 0
+    for (token,) in conn.execute('SELECT api_key_encrypted FROM api_keys'):
+        count += stale(token if isinstance(token, bytes) else token.encode())
+    if os.path.exists(filename):
+        with open(filename, 'r') as file:
+            for line in file:
+                parts = line.strip().split(':')
+                if len(parts) == 3:
+                    count += stale(parts[2].encode())
+    return count
+
+def _init_rotation_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS key_rotation (
+            key_id TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL DEFAULT 0,
+            db_done INTEGER NOT NULL DEFAULT 0,
+            file_done INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.commit()
+
+def _rotate_db(conn, pool, workers, keys, key_id, last_id, batch_size):
+    rows = 0
+    c = conn.cursor()
+    while True:
+        c.execute('SELECT id, api_key_encrypted FROM api_keys WHERE id > ? ORDER BY id LIMIT ?',
+                  (last_id, batch_size))
+        batch = c.fetchall()
+        if not batch:
+            break
+        tokens = [bytes(token) if isinstance(token, bytes) else token.encode() for _, token in batch]
+        rotated = _rotate_batch(pool, workers, keys, tokens)
+        # Only replace the token we read; a row rewritten meanwhile already uses the new keyring
+        c.executemany('UPDATE api_keys SET api_key_encrypted = ? WHERE id = ? AND api_key_encrypted = ?',
+                      [(new, row_id, old) for (row_id, old), new in zip(batch, rotated)])
+        last_id = batch[-1][0]
+        c.execute('UPDATE key_rotation SET last_id = ? WHERE key_id = ?', (last_id, key_id))
+        conn.commit()
+        rows += len(batch)
+    c.execute('UPDATE key_rotation SET db_done = 1 WHERE key_id = ?', (key_id,))
+    conn.commit()
+    return rows
+
+def _rotate_file(filename, pool, workers, keys, batch_size):
+    tmp_path = filename + '.rotating'
+    done = 0
+    # Resume: keep the complete lines already written and drop a torn last line
+    if os.path.exists(tmp_path):
+        with open(tmp_path, 'rb+') as tmp:
+            data = tmp.read()
+            keep = data.rfind(b'\n') + 1
+            tmp.truncate(keep)
+            done = data.count(b'\n', 0, keep)
+    lines = 0
+    with open(filename, 'r') as src, open(tmp_path, 'a') as dst:
+        for _ in range(done):
+            src.readline()
+        while True:
+            batch = [line for line in (src.readline() for _ in range(batch_size)) if line]
+            if not batch:
+                break
+            parsed = [line.rstrip('\n').split(':') for line in batch]
+            tokens = [parts[2].encode() for parts in parsed if len(parts) == 3]
+            rotated = iter(_rotate_batch(pool, workers, keys, tokens))
+            out = []
+            for line, parts in zip(batch, parsed):
+                if len(parts) == 3:
+                    out.append(f"{parts[0]}:{parts[1]}:{next(rotated).decode()}\n")
+                else:
+                    out.append(line if line.endswith('\n') else line + '\n')  # Keep lines we cannot parse untouched
+            dst.writelines(out)
+            dst.flush()
+            os.fsync(dst.fileno())
+            lines += len(batch)
+    os.replace(tmp_path, filename)
+    return lines
+
+def _rotation_pool(workers):
+    """Returns a process pool for rotation, or None to rotate in this process.
+
+    Workers are forked: they inherit this module as loaded, however it was
+    imported. Spawned workers would have to import it by name, which fails
+    for a module loaded from cred-manager.py by path.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    if workers <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+        return None
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork'))
+
+def _rotate_store(store, batch_size, workers):
+    from cryptography.fernet import Fernet
+    start = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    conn = store.connect()
+    _init_rotation_table(conn)
+    keys = load_keyring(store.key_path)
+
+    row = conn.execute('SELECT key_id, last_id, db_done, file_done FROM key_rotation '
+                       'WHERE NOT (db_done AND file_done)').fetchone()
+    if row and row[0] == _key_id(keys[0]):
+        key_id, last_id, db_done, file_done = row
+        resumed = True
+    else:
+        keys = [Fernet.generate_key()] + keys
+        key_id, last_id, db_done, file_done = _key_id(keys[0]), 0, 0, 0
+        resumed = False
+        conn.execute('DELETE FROM key_rotation WHERE NOT (db_done AND file_done)')
+        conn.execute('INSERT INTO key_rotation (key_id) VALUES (?)', (key_id,))
+        conn.commit()
+        save_keyring(keys, store.key_path)
+
+    # From here on this store encrypts with the new key and decrypts with any key
+    store.keyring.replace(keys)
+    keys = tuple(keys)
+
+    rows = lines = 0
+    pool = _rotation_pool(workers)
+    try:
+        if not db_done:
+            rows = _rotate_db(conn, pool, workers, keys, key_id, last_id, batch_size)
+        if not file_done:
+            if os.path.exists(store.filename):
+                lines = _rotate_file(store.filename, pool, workers, keys, batch_size)
+            conn.execute('UPDATE key_rotation SET file_done = 1 WHERE key_id = ?', (key_id,))
+            conn.commit()
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        conn.close()
+
+    elapsed = time.perf_counter() - start
+    return {
+        'resumed': resumed,
+        'last_id': last_id,
+        'db_rows': rows,
+        'file_lines': lines,
+        'seconds': elapsed,
+        'rows_per_sec': (rows + lines) / elapsed if elapsed else 0.0,
+    }
+
+def rotate_keys(db_path='credentials.db', filename='api_keys.txt', key_path='encryption.key',
+                batch_size=ROTATION_BATCH_SIZE, workers=None):
+    """Rotates to a new primary key and re-encrypts the database and key file.
+
+    Resumes an unfinished rotation instead of starting a new one. Returns a
+    dict with row counts, elapsed time and rows/sec.
+    """
+    store = _store_for(db_path, filename) if key_path == STORE.key_path else CredentialStore(db_path, filename, key_path)
+    stats = store.rotate_keys(batch_size, workers)
+    if stats['resumed']:
+        print(f"Resumed key rotation after row id {stats['last_id']}.")
+    print(f"Key rotation complete: {stats['db_rows']} DB rows and {stats['file_lines']} file entries re-encrypted "
+          f"in {stats['seconds']:.2f}s ({stats['rows_per_sec']:.0f} rows/sec).")
+    return stats
+
+def retire_old_keys(key_path='encryption.key'):
+    """Drops every key but the primary. Only do this after rotate_keys() has finished."""
+    store = STORE if key_path == STORE.key_path else CredentialStore(key_path=key_path)
+    try:
+        print(f"Retired {store.retire_old_keys()} old key(s).")
+    except RuntimeError as e:
+        print(f"Not retiring old keys: {e}")
+
+
+# Interactive menu
+def interactive_menu(store):
+    """Menu-driven loop for storing and retrieving keys by hand."""
+    hash_table = HashTable()
+    filename = store.filename
 
     while True:
         print("\nChoose an option:")
@@ -242,18 +1320,19 @@ def main():
         print("3. Store API key (In-Memory/File)")
         print("4. Retrieve API key (In-Memory/File)")
         print("5. List available keys (In-Memory/File)")
-        print("6. Exit")
+        print("6. Rotate encryption key")
+        print("7. Exit")
 
-        choice = input("Enter your choice (1-6): ")
+        choice = input("Enter your choice (1-7): ")
 
         if choice == "1":
             service_name = input("Enter service name: ")
             api_key = input("Enter API key: ")
-            store_api_key(service_name, api_key)
+            store_api_key(service_name, api_key, store.db_path)
 
         elif choice == "2":
             service_name = input("Enter service name to retrieve: ")
-            retrieved_key = retrieve_api_key(service_name)
+            retrieved_key = retrieve_api_key(service_name, store.db_path)
             if retrieved_key:
                 print(f"Retrieved API key: {retrieved_key}")
 
@@ -295,14 +1374,154 @@ def main():
                 print("Invalid retrieval choice.")
 
         elif choice == "5":
-            list_available_keys(hash_table, filename)
+            list_available_keys(hash_table, filename, store.db_path)
 
         elif choice == "6":
+            rotate_keys(store.db_path, store.filename, store.key_path)
+            # Re-encrypt the in-memory entries too, so the old key can be retired safely
+            cipher = store.keyring.cipher
+            for service, (hashed_key, encrypted_key) in list(hash_table.items()):
+                hash_table.insert(service, (hashed_key, cipher.rotate(encrypted_key)))
+
+        elif choice == "7":
             print("Exiting...")
             break
 
         else:
-            print("Invalid choice. Please enter 1, 2, 3, 4, 5 or 6.")
+            print("Invalid choice. Please enter 1, 2, 3, 4, 5, 6 or 7.")
+
+
+# One-shot commands
+# These skip the menu loop, so scripts can call e.g.
+#   python cred-manager.py get github
+# and pay only for the work that command needs.
+def cmd_get(store, args):
+    from cryptography.fernet import InvalidToken
+    try:
+        if args.backend == "sqlite":
+            api_key = store.get(args.service)
+        else:
+            api_key = store.get_file(args.service)
+    except FileNotFoundError:
+        api_key = None
+    except InvalidToken:
+        print(f"Error retrieving API key for {args.service}: it cannot be decrypted "
+              f"(corrupt entry, or encrypted with a key no longer in {store.key_path}).", file=sys.stderr)
+        return 1
+    if api_key is None:
+        print(f"No API key found for {args.service}.", file=sys.stderr)
+        return 1
+    print(api_key)
+    return 0
+
+def cmd_put(store, args):
+    api_key = args.api_key
+    if api_key is None:
+        # Read the key from stdin so it stays out of shell history and process listings
+        api_key = sys.stdin.readline().rstrip("\n")
+    if not api_key:
+        print("Error: empty API key.", file=sys.stderr)
+        return 1
+    if args.backend == "sqlite":
+        store.put(args.service, api_key)
+    else:
+        store.put_file(args.service, api_key)
+    print(f"API key for {args.service} stored ({args.backend}).", file=sys.stderr)
+    return 0
+
+def cmd_list(store, args):
+    try:
+        services = store.list_services() if args.backend == "sqlite" else store.list_file_services()
+    except FileNotFoundError:
+        services = []
+    for service in services:
+        print(service)
+    return 0
+
+def cmd_rotate(store, args):
+    stats = store.rotate_keys(args.batch_size, args.workers)
+    print(f"Re-encrypted {stats['db_rows']} DB rows and {stats['file_lines']} file entries "
+          f"in {stats['seconds']:.2f}s ({stats['rows_per_sec']:.0f} rows/sec).")
+    return 0
+
+def cmd_serve(store, args):
+    import asyncio
+    daemon = CredentialDaemon(store, args.socket, args.backend, args.cache_size, args.workers)
+    dump = None
+    if isinstance(store.metrics, Metrics) and args.metrics:
+        dump = lambda: write_metrics(store.metrics, args)
+    asyncio.run(daemon.serve_forever(preload=args.preload, dump_metrics=dump, metrics_interval=args.metrics_interval))
+    return 0
+
+def write_metrics(metrics, args):
+    if args.metrics:
+        metrics.dump(args.metrics, args.metrics_format)
+    if args.profile:
+        metrics.dump_profile(args.profile)
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Credential Manager. Runs the interactive menu when no command is given.")
+    parser.add_argument("--db", default="credentials.db", help="SQLite database path (default: credentials.db)")
+    parser.add_argument("--file", default="api_keys.txt", help="Key file path (default: api_keys.txt)")
+    parser.add_argument("--key-file", default="encryption.key", help="Keyring path (default: encryption.key)")
+    parser.add_argument("--quiet", action="store_true", help="Turn off the per-call status messages")
+    parser.add_argument("--metrics", help="Write latency histograms and counters to this file on exit")
+    parser.add_argument("--metrics-format", choices=["json", "prometheus"], default="json",
+                        help="Format of the --metrics file (default: json)")
+    parser.add_argument("--metrics-interval", type=float, default=10.0,
+                        help="With serve, also rewrite the --metrics file every N seconds (default: 10)")
+    parser.add_argument("--profile", help="Run store/retrieve calls under cProfile and write the stats here")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Record the peak traced memory of each store/retrieve call")
+    sub = parser.add_subparsers(dest="command")
+
+    p = sub.add_parser("get", help="Print the API key for a service")
+    p.add_argument("service")
+    p.add_argument("--backend", choices=["sqlite", "file"], default="sqlite")
+    p.set_defaults(func=cmd_get)
+
+    p = sub.add_parser("put", help="Store an API key (read from stdin if not given)")
+    p.add_argument("service")
+    p.add_argument("api_key", nargs="?")
+    p.add_argument("--backend", choices=["sqlite", "file"], default="sqlite")
+    p.set_defaults(func=cmd_put)
+
+    p = sub.add_parser("list", help="List stored service names")
+    p.add_argument("--backend", choices=["sqlite", "file"], default="sqlite")
+    p.set_defaults(func=cmd_list)
+
+    p = sub.add_parser("rotate", help="Rotate the encryption key and re-encrypt stored keys")
+    p.add_argument("--batch-size", type=int, default=ROTATION_BATCH_SIZE)
+    p.add_argument("--workers", type=int, default=None)
+    p.set_defaults(func=cmd_rotate)
+
+    p = sub.add_parser("serve", help="Run the credential daemon on a Unix socket")
+    p.add_argument("--socket", default="cred-manager.sock", help="Socket path (default: cred-manager.sock)")
+    p.add_argument("--backend", choices=["sqlite", "file"], default="sqlite")
+    p.add_argument("--cache-size", type=int, default=10000, help="Decrypted keys kept in memory (default: 10000)")
+    p.add_argument("--workers", type=int, default=8, help="Threads for SQLite/file/Fernet work (default: 8)")
+    p.add_argument("--preload", action="store_true", help="Decrypt all stored keys into the cache at startup")
+    p.set_defaults(func=cmd_serve)
+    return parser
+
+# Main function to interact with the user
+def main(argv=None):
+    """Runs a one-shot command, or the interactive menu if none is given."""
+    global STORE, VERBOSE
+    args = build_parser().parse_args(argv)
+    VERBOSE = not args.quiet
+    metrics = None
+    if args.metrics or args.profile or args.trace_memory:
+        metrics = Metrics(profile=bool(args.profile), trace_memory=args.trace_memory)
+    STORE = CredentialStore(args.db, args.file, args.key_file, metrics=metrics)
+    try:
+        if args.command is None:
+            interactive_menu(STORE)
+            return 0
+        return args.func(STORE, args)
+    finally:
+        if metrics is not None:
+            write_metrics(metrics, args)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
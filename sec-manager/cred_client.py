@@ -0,0 +1,136 @@
+# Credential Manager client
+#
+# Thin client for the credential daemon (python cred-manager.py serve).
+# Talks to it over a Unix domain socket using the length-prefixed protocol
+# below, so callers get keys without opening SQLite or decrypting anything.
+#
+# Protocol
+#   frame    = length (4 bytes, big-endian) + body
+#   request  = opcode (1 byte) + fields
+#   response = status (1 byte) + fields
+#   field    = length (4 bytes, big-endian) + UTF-8 bytes; length 0xFFFFFFFF means "none"
+#
+#   G service          -> OK key | NOT_FOUND
+#   P service key      -> OK
+#   L                  -> OK service...
+#   M service...       -> OK (key or none)...
+# An ERROR response carries one field with the message. Responses on a
+# connection come back in request order, so requests can be pipelined.
+
+import socket
+import struct
+
+DEFAULT_SOCKET = "cred-manager.sock"
+
+OP_GET = b"G"
+OP_PUT = b"P"
+OP_LIST = b"L"
+OP_GET_MANY = b"M"
+
+STATUS_OK = b"K"
+STATUS_NOT_FOUND = b"N"
+STATUS_ERROR = b"E"
+
+_LEN = struct.Struct("!I")
+_NONE = 0xFFFFFFFF
+MAX_FRAME = 16 * 1024 * 1024
+
+
+def encode_frame(tag, fields=()):
+    """Builds one frame from a 1-byte tag and a list of str/bytes/None fields."""
+    parts = [tag]
+    for field in fields:
+        if field is None:
+            parts.append(_LEN.pack(_NONE))
+            continue
+        if isinstance(field, str):
+            field = field.encode()
+        parts.append(_LEN.pack(len(field)))
+        parts.append(field)
+    body = b"".join(parts)
+    return _LEN.pack(len(body)) + body
+
+
+def decode_body(body):
+    """Splits a frame body into (tag, [str or None, ...])."""
+    tag = body[:1]
+    fields = []
+    pos = 1
+    while pos < len(body):
+        (length,) = _LEN.unpack_from(body, pos)
+        pos += 4
+        if length == _NONE:
+            fields.append(None)
+            continue
+        fields.append(body[pos:pos + length].decode())
+        pos += length
+    return tag, fields
+
+
+class DaemonError(Exception):
+    """Raised when the daemon answers a request with an error."""
+
+
+class CredentialClient:
+    """Blocking client for the credential daemon. Use one client per thread."""
+
+    def __init__(self, socket_path=DEFAULT_SOCKET, timeout=5.0):
+        self.socket_path = socket_path
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.settimeout(timeout)
+        self._sock.connect(socket_path)
+        self._reader = self._sock.makefile("rb")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._reader.close()
+        self._sock.close()
+
+    def _read_response(self):
+        header = self._reader.read(4)
+        if len(header) < 4:
+            raise ConnectionError("Daemon closed the connection")
+        (length,) = _LEN.unpack(header)
+        body = self._reader.read(length)
+        if len(body) < length:
+            raise ConnectionError("Daemon closed the connection")
+        status, fields = decode_body(body)
+        if status == STATUS_ERROR:
+            raise DaemonError(fields[0] if fields else "unknown error")
+        return status, fields
+
+    def _call(self, op, fields=()):
+        self._sock.sendall(encode_frame(op, fields))
+        return self._read_response()
+
+    def get(self, service):
+        """Returns the API key for service, or None if it is not stored."""
+        status, fields = self._call(OP_GET, [service])
+        return fields[0] if status == STATUS_OK else None
+
+    def put(self, service, api_key):
+        self._call(OP_PUT, [service, api_key])
+
+    def list(self):
+        """Returns the stored service names."""
+        return self._call(OP_LIST)[1]
+
+    def get_many(self, services):
+        """Returns {service: api_key or None} using a single request."""
+        services = list(services)
+        return dict(zip(services, self._call(OP_GET_MANY, services)[1]))
+
+    def get_pipelined(self, services):
+        """Sends one GET per service without waiting, then reads the answers in order."""
+        services = list(services)
+        self._sock.sendall(b"".join(encode_frame(OP_GET, [s]) for s in services))
+        results = []
+        for _ in services:
+            status, fields = self._read_response()
+            results.append(fields[0] if status == STATUS_OK else None)
+        return results
@@ -0,0 +1,176 @@
+# Mock WHOIS server
+#
+# A local stand-in for real registries, so whois-utility.py can be tested and
+# benchmarked offline without being rate limited. It speaks port-43 WHOIS:
+# read one query line, write the answer, close the connection.
+#
+# Two listeners are started: a "registry" on --port and a "registrar" on
+# --port + 1. Queries without a dot (TLDs, as IANA gets them) are answered
+# with a referral to the registry. A --referral-rate share of domains gets a
+# thin registry answer that only points at the registrar, which then answers
+# with the registrar name, as .com does.
+#
+# usage: python mock-whois-server.py --port 4343 --latency 50 --jitter 20 --error-rate 0.02
+
+import argparse
+import asyncio
+import hashlib
+import random
+import time
+
+REGISTRY_RESPONSE = '''Domain Name: {domain_upper}
+Registry Domain ID: {domain_id}_DOMAIN-MOCK
+Registrar WHOIS Server: {registrar_server}
+Updated Date: 2024-08-14T07:01:34Z
+Creation Date: 2001-08-14T04:00:00Z
+Registry Expiry Date: 2030-08-13T04:00:00Z
+{registrar_line}Domain Status: clientTransferProhibited https://icann.org/epp#clientTransferProhibited
+Name Server: NS1.{domain_upper}
+Name Server: NS2.{domain_upper}
+DNSSEC: unsigned
+>>> Last update of whois database: 2024-10-01T12:00:00Z <<<
+
+TERMS OF USE: This is a mock WHOIS server for local testing only.
+'''
+
+REGISTRAR_RESPONSE = '''Domain Name: {domain}
+Registrar WHOIS Server: {registrar_server}
+Creation Date: 2001-08-14T04:00:00+0000
+Registrar Registration Expiration Date: 2030-08-13T04:00:00+0000
+Registrar: {registrar}
+Registrar IANA ID: 9999
+Registrant Organization: REDACTED FOR PRIVACY
+Name Server: ns1.{domain}
+Name Server: ns2.{domain}
+'''
+
+NO_MATCH_RESPONSE = 'No match for "{domain_upper}".\r\n'
+RATE_LIMIT_RESPONSE = '%ERROR:201: access denied - query rate limit exceeded\r\n'
+REGISTRARS = ['Mock Registrar, Inc.', 'Example Names LLC', 'Test Domains GmbH', 'Sample Registry Services Ltd']
+
+
+def domain_hash(domain):
+    """Stable per-domain number in [0, 1), so a domain always gets the same kind of answer."""
+    return int.from_bytes(hashlib.sha1(domain.encode()).digest()[:8], 'big') / 2 ** 64
+
+
+class MockWhoisServer:
+    """Serves canned WHOIS answers with configurable latency, failures and rate limits."""
+
+    def __init__(self, host='127.0.0.1', port=4343, latency=0.0, jitter=0.0, error_rate=0.0,
+                 rate_limit=0.0, referral_rate=0.0, not_found_rate=0.0, seed=None):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit          # Queries per second per client; 0 = unlimited
+        self.referral_rate = referral_rate
+        self.not_found_rate = not_found_rate
+        self.random = random.Random(seed)
+        self.queries = 0
+        self.errors = 0
+        self.refused = 0
+        self._buckets = {}                    # client address -> (tokens, updated)
+
+    @property
+    def registry_server(self):
+        return f'{self.host}:{self.port}'
+
+    @property
+    def registrar_server(self):
+        return f'{self.host}:{self.port + 1}'
+
+    def _allow(self, client):
+        # Token bucket per client with one second of burst
+        if not self.rate_limit:
+            return True
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(client, (self.rate_limit, now))
+        tokens = min(self.rate_limit, tokens + (now - updated) * self.rate_limit)
+        if tokens < 1:
+            self._buckets[client] = (tokens, now)
+            return False
+        self._buckets[client] = (tokens - 1, now)
+        return True
+
+    def answer(self, query, registrar_hop):
+        if '.' not in query:
+            return f'refer:        {self.registry_server}\r\n\r\ndomain:       {query.upper()}\r\n'
+        h = domain_hash(query)
+        fields = {
+            'domain': query,
+            'domain_upper': query.upper(),
+            'domain_id': int(h * 10 ** 9),
+            'registrar_server': self.registrar_server,
+            'registrar': REGISTRARS[int(h * 1000) % len(REGISTRARS)],
+        }
+        if h < self.not_found_rate:
+            return NO_MATCH_RESPONSE.format(**fields)
+        if registrar_hop:
+            return REGISTRAR_RESPONSE.format(**fields)
+        referred = 1 - h < self.referral_rate
+        fields['registrar_line'] = '' if referred else f"Registrar: {fields['registrar']}\n"
+        return REGISTRY_RESPONSE.format(**fields)
+
+    async def handle(self, reader, writer, registrar_hop=False):
+        try:
+            query = (await reader.readline()).decode('utf-8', errors='replace').strip().lower()
+            self.queries += 1
+            delay = self.latency + self.random.uniform(-self.jitter, self.jitter)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            client = writer.get_extra_info('peername')[0]
+            if not self._allow(client):
+                self.refused += 1
+                writer.write(RATE_LIMIT_RESPONSE.encode())
+            elif self.random.random() < self.error_rate:
+                self.errors += 1  # Drop the connection without an answer
+            else:
+                text = self.answer(query, registrar_hop).replace('\r\n', '\n').replace('\n', '\r\n')
+                writer.write(text.encode())
+                await writer.drain()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self):
+        self._servers = [
+            await asyncio.start_server(self.handle, self.host, self.port),
+            await asyncio.start_server(lambda r, w: self.handle(r, w, registrar_hop=True), self.host, self.port + 1),
+        ]
+        return self
+
+    async def serve_forever(self):
+        await self.start()
+        print(f'Mock WHOIS server listening on {self.registry_server} (registry) and {self.registrar_server} (registrar)',
+              flush=True)
+        await asyncio.gather(*(server.serve_forever() for server in self._servers))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mock WHOIS server for offline testing')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=4343, help='Registry port; the registrar listens on PORT+1 (default: 4343)')
+    parser.add_argument('--latency', type=float, default=50, help='Mean response delay in ms (default: 50)')
+    parser.add_argument('--jitter', type=float, default=0, help='Delay varies uniformly by +/- this many ms (default: 0)')
+    parser.add_argument('--error-rate', type=float, default=0, help='Share of queries dropped without an answer (default: 0)')
+    parser.add_argument('--rate-limit', type=float, default=0,
+                        help='Queries per second allowed per client before "rate limit exceeded" (default: unlimited)')
+    parser.add_argument('--referral-rate', type=float, default=0,
+                        help='Share of domains whose registry answer only refers to the registrar (default: 0)')
+    parser.add_argument('--not-found-rate', type=float, default=0, help='Share of domains answered "No match" (default: 0)')
+    parser.add_argument('--seed', type=int, help='Random seed for jitter and errors')
+    args = parser.parse_args()
+
+    server = MockWhoisServer(args.host, args.port, args.latency / 1000, args.jitter / 1000, args.error_rate,
+                             args.rate_limit, args.referral_rate, args.not_found_rate, args.seed)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        print(f'\n{server.queries} queries, {server.errors} dropped, {server.refused} rate limited')
+
+
+if __name__ == '__main__':
+    main()
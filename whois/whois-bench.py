@@ -0,0 +1,259 @@
+# Whois Lookup benchmarks
+#
+# Benchmarks for whois-utility.py. None of them need network access: the
+# parser benchmark runs over the saved WHOIS responses in samples/, and the
+# lookups benchmark drives the asyncio lookup pipeline against
+# mock-whois-server.py on localhost.
+
+import argparse
+import asyncio
+import contextlib
+import glob
+import importlib.util
+import os
+import socket
+import subprocess
+import sys
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SAMPLES_DIR = os.path.join(HERE, 'samples')
+MOCK_SERVER = os.path.join(HERE, 'mock-whois-server.py')
+
+# Domain to hand python-whois for each sample, keyed by file name prefix;
+# its parser picks a registry-specific format from the TLD.
+SAMPLE_DOMAINS = {
+    'com': 'example.com',
+    'org': 'example.org',
+    'io': 'example.io',
+    'uk': 'example.co.uk',
+    'de': 'example.de',
+    'fr': 'example.fr',
+    'eu': 'example.eu',
+    'jp': 'example.jp',
+}
+
+
+def load_whois_utility():
+    """Imports whois-utility.py (the hyphen keeps it from being imported normally)."""
+    spec = importlib.util.spec_from_file_location('whois_utility', os.path.join(HERE, 'whois-utility.py'))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_samples(path=SAMPLES_DIR):
+    """Returns [(name, domain, text)] for every saved response."""
+    samples = []
+    for filename in sorted(glob.glob(os.path.join(path, '*.txt'))):
+        name = os.path.basename(filename)[:-4]
+        with open(filename, encoding='utf-8') as f:
+            samples.append((name, SAMPLE_DOMAINS.get(name.split('-')[0], 'example.com'), f.read()))
+    return samples
+
+
+def timed(fn, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return time.perf_counter() - start
+
+
+def report(name, n, seconds, baseline=None):
+    per_item = seconds / n * 1e6
+    line = f'{name:<34} {per_item:>10.1f} us/response  {n / seconds:>12,.0f} responses/sec'
+    if baseline:
+        line += f'  {baseline / seconds:>6.1f}x'
+    print(line)
+
+
+def bench_parser(args):
+    wu = load_whois_utility()
+    samples = load_samples(args.samples)
+    if not samples:
+        print(f'No samples found in {args.samples}')
+        return
+    n = len(samples) * args.rounds
+    print(f'Parser benchmark: {len(samples)} saved responses x {args.rounds} rounds\n')
+
+    if args.verbose:
+        for name, domain, text in samples:
+            print(f'{name:<18} {wu.parse_whois(text)}')
+        print()
+
+    # python-whois builds a full WhoisEntry; that is what whois.whois() did per domain
+    from whois.parser import WhoisEntry
+
+    def full_parse():
+        for name, domain, text in samples:
+            try:
+                WhoisEntry.load(domain, text)
+            except Exception:
+                pass  # e.g. "No match" raises; it still cost the parse
+
+    def registrar_only():
+        for name, domain, text in samples:
+            wu.extract_registrar(text)
+
+    def all_fields():
+        for name, domain, text in samples:
+            wu.parse_whois(text)
+
+    baseline = timed(full_parse, args.rounds)
+    report('python-whois WhoisEntry.load', n, baseline)
+    report('extract_registrar', n, timed(registrar_only, args.rounds), baseline)
+    report('parse_whois (all fields)', n, timed(all_fields, args.rounds), baseline)
+
+
+def free_port_pair():
+    """Returns a port p where both p and p + 1 are free (registry and registrar)."""
+    for _ in range(50):
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            port = s.getsockname()[1]
+        try:
+            with socket.socket() as s:
+                s.bind(('127.0.0.1', port + 1))
+            return port
+        except OSError:
+            continue
+    raise RuntimeError('No free port pair found')
+
+
+def start_mock_server(args):
+    """Starts mock-whois-server.py in its own process, so it doesn't share the event loop being measured."""
+    port = args.port or free_port_pair()
+    proc = subprocess.Popen([sys.executable, MOCK_SERVER, '--port', str(port),
+                             '--latency', str(args.latency), '--jitter', str(args.jitter),
+                             '--error-rate', str(args.error_rate), '--rate-limit', str(args.server_rate_limit),
+                             '--referral-rate', str(args.referral_rate), '--seed', '1'],
+                            stdout=subprocess.PIPE, text=True)
+    line = proc.stdout.readline()  # Printed once both listeners are up
+    if 'listening' not in line:
+        proc.kill()
+        raise RuntimeError(f'Mock server failed to start: {line.strip()}')
+    return proc, port
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+def run_lookups(wu, size, concurrency, port, args):
+    """One pass of the lookup pipeline; returns a dict of measurements."""
+    domains = [f'bench{i}.test' for i in range(size)]
+    latencies = []
+    lookup_once = wu.async_lookup_once
+
+    # Time every query attempt, including the ones that fail and are retried
+    async def timed_lookup(*a, **kw):
+        start = time.perf_counter()
+        try:
+            return await lookup_once(*a, **kw)
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+    scheduler = wu.ServerScheduler(rate=args.client_rate, burst=max(1, int(args.client_rate)), key=lambda d: 'mock')
+    controller = wu.ConcurrencyController(concurrency, adaptive=args.adaptive)
+    wu.async_lookup_once = timed_lookup
+    if args.memory:
+        tracemalloc.start()
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stderr(devnull):  # "Retrying ..." lines
+            start = time.perf_counter()
+            results = asyncio.run(wu.run_async_lookups(domains, concurrency, ('127.0.0.1', port), args.timeout,
+                                                       retries=args.retries, scheduler=scheduler,
+                                                       rate_limit_pause=args.rate_limit_pause, controller=controller))
+            elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] if args.memory else None
+    finally:
+        wu.async_lookup_once = lookup_once
+        if args.memory:
+            tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        'seconds': elapsed,
+        'qps': controller.queries / elapsed if elapsed else 0.0,
+        'p50': percentile(latencies, 0.50),
+        'p99': percentile(latencies, 0.99),
+        'retries': controller.queries - len(results),
+        'failed': sum(str(r['registrar']).startswith('Error') for r in results),
+        'peak': peak,
+        'limit': controller.limit,
+        'correct': len(results) == size,
+    }
+
+
+def bench_lookups(args):
+    wu = load_whois_utility()
+    sizes = [int(v) for v in args.sizes.split(',')]
+    levels = [int(v) for v in args.concurrency.split(',')]
+    proc, port = start_mock_server(args)
+    try:
+        print(f'Lookup pipeline against the mock server on 127.0.0.1:{port}: latency {args.latency:g}ms '
+              f'+/- {args.jitter:g}ms, {args.error_rate:.0%} dropped, {args.referral_rate:.0%} referred'
+              + (f', {args.server_rate_limit:g} qps limit' if args.server_rate_limit else '')
+              + (' (adaptive concurrency)' if args.adaptive else '') + '\n')
+        print(f"{'domains':>8} {'conc':>5} {'seconds':>8} {'queries/s':>10} {'p50 ms':>8} {'p99 ms':>8} "
+              f"{'retries':>8} {'failed':>7} {'peak MB':>8}" + (f" {'final':>6}" if args.adaptive else ''))
+        for size in sizes:
+            for concurrency in levels:
+                r = run_lookups(wu, size, concurrency, port, args)
+                peak = f"{r['peak'] / 1e6:>8.1f}" if r['peak'] is not None else f"{'-':>8}"
+                line = (f"{size:>8} {concurrency:>5} {r['seconds']:>8.2f} {r['qps']:>10.1f} {r['p50'] * 1000:>8.1f} "
+                        f"{r['p99'] * 1000:>8.1f} {r['retries']:>8} {r['failed']:>7} {peak}")
+                if args.adaptive:
+                    line += f" {r['limit']:>6}"
+                if not r['correct']:
+                    line += '  (result count mismatch!)'
+                print(line, flush=True)
+    finally:
+        proc.terminate()
+        proc.wait()
+    if args.memory:
+        print('\nPeak MB is Python heap allocations during the run (tracemalloc), which also slows the run down; '
+              'use --no-memory for raw throughput.')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Whois Lookup benchmarks')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('parser', help='Fast field extraction vs python-whois full parsing over saved responses')
+    p.add_argument('--samples', default=SAMPLES_DIR, help='Directory of saved responses (*.txt)')
+    p.add_argument('--rounds', type=int, default=200, help='Passes over the corpus (default: 200)')
+    p.add_argument('--verbose', action='store_true', help='Print what parse_whois() found in each sample')
+    p.set_defaults(func=bench_parser)
+
+    p = sub.add_parser('lookups', help='asyncio lookup pipeline against a local mock WHOIS server')
+    p.add_argument('--sizes', default='100,1000', help='Comma-separated list sizes (default: 100,1000)')
+    p.add_argument('--concurrency', default='10,50,200', help='Comma-separated concurrency levels (default: 10,50,200)')
+    p.add_argument('--adaptive', action='store_true', help='Use adaptive concurrency, with each level as the maximum')
+    p.add_argument('--latency', type=float, default=20, help='Mock server response delay in ms (default: 20)')
+    p.add_argument('--jitter', type=float, default=10, help='Mock server delay jitter in ms (default: 10)')
+    p.add_argument('--error-rate', type=float, default=0.01, help='Share of queries the mock drops (default: 0.01)')
+    p.add_argument('--referral-rate', type=float, default=0.2,
+                   help='Share of domains that need a registrar hop (default: 0.2)')
+    p.add_argument('--server-rate-limit', type=float, default=0,
+                   help='Mock server per-client qps before it refuses (default: unlimited)')
+    p.add_argument('--client-rate', type=float, default=100000,
+                   help='Scheduler rate towards the mock server in qps (default: 100000, i.e. unthrottled)')
+    p.add_argument('--rate-limit-pause', type=float, default=0.5,
+                   help='Seconds to rest the server after a rate-limit refusal (default: 0.5)')
+    p.add_argument('--retries', type=int, default=3, help='Attempts per domain (default: 3)')
+    p.add_argument('--timeout', type=float, default=5, help='Per-query timeout in seconds (default: 5)')
+    p.add_argument('--port', type=int, help='Mock server port (default: a free one)')
+    p.add_argument('--no-memory', dest='memory', action='store_false', help='Skip tracemalloc peak memory')
+    p.set_defaults(func=bench_lookups)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -14,15 +14,431 @@ import queue
 import random
 import argparse
 import json
+import asyncio
+import re
+import sqlite3
+import heapq
+import socket
+import csv
+import sys
+import os
+from collections import deque
 
-def lookup_registrar(domain_queue, results):
+WHOIS_PORT = 43
+IANA_WHOIS_SERVER = 'whois.iana.org'
+MAX_REFERRALS = 2  # registry -> registrar hops to follow after the IANA lookup
+
+# Registrar labels, matched as "Label: value" at the start of a line. Some
+# registries (e.g. .uk) put the value on the following line instead.
+REGISTRAR_RE = re.compile(r'^[ \t]*(?:registrar|sponsoring registrar|registrar name)[ \t]*:[ \t]*(.*)$',
+                          re.IGNORECASE | re.MULTILINE)
+NAME_PREFIX_RE = re.compile(r'^name:[ \t]*', re.IGNORECASE)
+REFERRAL_RE = re.compile(r'^[ \t]*(?:refer|whois|registrar whois server)[ \t]*:[ \t]*(\S+)[ \t\r]*$',
+                         re.IGNORECASE | re.MULTILINE)
+
+# Persistent result cache
+# Registrars rarely change, so results are kept in a small SQLite database
+# keyed by normalized domain. Good answers live for `ttl` seconds; "Not
+# found" and error results get the shorter `negative_ttl` so they are retried
+# sooner.
+DEFAULT_CACHE_PATH = 'whois_cache.db'
+DEFAULT_CACHE_TTL = 7 * 24 * 3600
+DEFAULT_NEGATIVE_TTL = 3600
+
+def normalize_domain(domain):
+    """Lowercases a domain and strips whitespace and a trailing dot."""
+    return domain.strip().lower().rstrip('.')
+
+def is_negative(registrar):
+    return registrar == 'Not found' or str(registrar).startswith('Error:')
+
+class WhoisCache:
+    """On-disk WHOIS cache with separate TTLs for good and negative results."""
+
+    COMMIT_EVERY = 100
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl=DEFAULT_CACHE_TTL, negative_ttl=DEFAULT_NEGATIVE_TTL):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._uncommitted = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS whois_cache (
+                domain TEXT PRIMARY KEY,
+                registrar TEXT NOT NULL,
+                raw TEXT,
+                negative INTEGER NOT NULL,
+                fetched_at REAL NOT NULL
+            )
+        ''')
+        self._conn.commit()
+
+    def get(self, domain, with_raw=False):
+        """Returns the cached registrar for domain, or None if missing or expired.
+
+        With with_raw, returns (registrar, raw response) instead.
+        """
+        with self._lock:
+            row = self._conn.execute('SELECT registrar, negative, fetched_at, raw FROM whois_cache WHERE domain = ?',
+                                     (normalize_domain(domain),)).fetchone()
+            if row:
+                registrar, negative, fetched_at, raw = row
+                if time.time() - fetched_at < (self.negative_ttl if negative else self.ttl):
+                    self.hits += 1
+                    return (registrar, raw) if with_raw else registrar
+            self.misses += 1
+            return None
+
+    def put(self, domain, registrar, raw=None):
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO whois_cache (domain, registrar, raw, negative, fetched_at) '
+                               'VALUES (?, ?, ?, ?, ?)',
+                               (normalize_domain(domain), str(registrar), raw, int(is_negative(registrar)), time.time()))
+            self._uncommitted += 1
+            if self._uncommitted >= self.COMMIT_EVERY:
+                self._conn.commit()
+                self._uncommitted = 0
+
+    def close(self):
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
+
+# Per-server rate limiting
+# Domains are grouped by the WHOIS server responsible for their TLD. Each
+# server gets its own token bucket and the groups are served round-robin, so
+# throughput comes from querying many registries in parallel rather than
+# from bursts against one of them.
+DEFAULT_RATE = 1.0             # Queries per second per server
+DEFAULT_BURST = 3
+DEFAULT_RATE_LIMIT_PAUSE = 60  # Seconds a server is left alone after it says we are over its limit
+MAX_RATE_LIMITED = 5           # Times a domain may be put back because of rate limiting
+
+# Registry WHOIS servers for common TLDs; other TLDs are grouped by TLD
+TLD_SERVERS = {
+    'com': 'whois.verisign-grs.com',
+    'net': 'whois.verisign-grs.com',
+    'org': 'whois.pir.org',
+    'info': 'whois.nic.info',
+    'io': 'whois.nic.io',
+    'ai': 'whois.nic.ai',
+    'co': 'whois.nic.co',
+    'uk': 'whois.nic.uk',
+    'de': 'whois.denic.de',
+    'fr': 'whois.nic.fr',
+    'nl': 'whois.domain-registry.nl',
+    'eu': 'whois.eu',
+    'us': 'whois.nic.us',
+    'ca': 'whois.cira.ca',
+    'au': 'whois.auda.org.au',
+    'jp': 'whois.jprs.jp',
+    'dev': 'whois.nic.google',
+    'app': 'whois.nic.google',
+}
+
+RATE_LIMIT_RE = re.compile(r'limit exceeded|rate limit|quota exceeded|limit reached|too many (?:requests|queries|connections)'
+                           r'|exceeded (?:the )?(?:maximum|allowed)|try again later', re.IGNORECASE)
+
+class RateLimited(Exception):
+    """The WHOIS server refused the query because we are over its rate limit."""
+
+def is_rate_limited(text):
+    """True if a WHOIS response is a rate-limit refusal rather than an answer."""
+    # Refusals are short; only look at the start so legal boilerplate further down cannot match
+    return bool(text) and RATE_LIMIT_RE.search(text[:1000]) is not None
+
+def is_timeout(error):
+    """True for socket (threads engine) and asyncio (async engine) timeouts."""
+    return isinstance(error, (TimeoutError, socket.timeout, asyncio.TimeoutError))
+
+def server_key(domain):
+    """Returns the WHOIS server (or, if unknown, the TLD) a domain's query goes to."""
+    tld = normalize_domain(domain).rsplit('.', 1)[-1]
+    return TLD_SERVERS.get(tld, tld)
+
+class TokenBucket:
+    """Allows `rate` queries per second with bursts of up to `burst`."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now):
+        """Seconds until a token is available (0 if one is available now)."""
+        if now < self.paused_until:
+            return self.paused_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def pause(self, now, seconds):
+        self.tokens = 0
+        self.paused_until = max(self.paused_until, now + seconds)
+
+class ServerScheduler:
+    """Queue of domains that hands them out per-server, round-robin and rate limited.
+
+    get()/task_done()/join() mirror queue.Queue for worker threads; aget() is
+    the asyncio equivalent and returns None once close() has been called and
+    every domain is finished. With maxsize, put() blocks while that many
+    domains are unfinished, which bounds memory when reading huge lists.
+    """
+
+    DONE = object()  # Handed to each worker by get() when there is no more work
+
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST, server_rates=None, key=server_key, maxsize=0):
+        self.rate = rate
+        self.burst = burst
+        # Limits may be given per server or per TLD
+        self.server_rates = {TLD_SERVERS.get(k, k): v for k, v in (server_rates or {}).items()}
+        self.key = key
+        self._queues = {}       # server -> deque of domains ready to go
+        self._ring = deque()    # servers with ready domains, in round-robin order
+        self._delayed = []      # heap of (not_before, seq, domain) for retries
+        self._seq = 0
+        self._buckets = {}
+        self._unfinished = 0
+        self._closed = False
+        self.maxsize = maxsize
+        self._cond = threading.Condition()
+
+    def _bucket(self, server):
+        bucket = self._buckets.get(server)
+        if bucket is None:
+            rate = self.server_rates.get(server, self.rate)
+            bucket = self._buckets[server] = TokenBucket(rate, max(1, min(self.burst, rate * self.burst)))
+        return bucket
+
+    def _ready(self, domain):
+        server = self.key(domain)
+        q = self._queues.get(server)
+        if q is None:
+            q = self._queues[server] = deque()
+        if not q:
+            self._ring.append(server)
+        q.append(domain)
+
+    def put(self, domain, delay=0, block=True):
+        """Adds a domain, optionally not to be handed out for `delay` seconds."""
+        with self._cond:
+            while block and self.maxsize and self._unfinished >= self.maxsize:
+                self._cond.wait()
+            self._unfinished += 1
+            if delay > 0:
+                self._seq += 1
+                heapq.heappush(self._delayed, (time.monotonic() + delay, self._seq, domain))
+            else:
+                self._ready(domain)
+            self._cond.notify_all()
+
+    def requeue(self, domain, delay=0, pause=0):
+        """Puts a domain back, e.g. for a retry; pause also rests its server for that long."""
+        if pause > 0:
+            with self._cond:
+                self._bucket(self.key(domain)).pause(time.monotonic(), pause)
+        self.put(domain, max(delay, pause), block=False)  # Never block a worker on its own retry
+
+    def _poll(self, now):
+        """Returns (domain, 0) if one may go now, else (None, seconds to wait or None)."""
+        while self._delayed and self._delayed[0][0] <= now:
+            self._ready(heapq.heappop(self._delayed)[2])
+        wait = self._delayed[0][0] - now if self._delayed else None
+        for _ in range(len(self._ring)):
+            server = self._ring[0]
+            bucket = self._bucket(server)
+            delay = bucket.delay(now)
+            if delay == 0:
+                bucket.take(now)
+                q = self._queues[server]
+                domain = q.popleft()
+                if q:
+                    self._ring.rotate(-1)  # Next call starts with the next server
+                else:
+                    self._ring.popleft()
+                return domain, 0
+            wait = delay if wait is None else min(wait, delay)
+            self._ring.rotate(-1)
+        return None, wait
+
+    def get(self, timeout=None):
+        """Blocks until a domain may be queried.
+
+        Returns the DONE sentinel once close() has been called and every
+        domain is finished, so workers know to exit. Raises queue.Empty after
+        timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                domain, wait = self._poll(now)
+                if domain is not None:
+                    return domain
+                if self._closed and self._unfinished == 0:
+                    return self.DONE
+                if deadline is not None:
+                    if now >= deadline:
+                        raise queue.Empty
+                    wait = deadline - now if wait is None else min(wait, deadline - now)
+                self._cond.wait(wait)
+
+    async def aget(self):
+        """Waits for the next domain.
+
+        Returns None when all work is finished, or when there is room for
+        more input and close() has not been called yet.
+        """
+        while True:
+            with self._cond:
+                domain, wait = self._poll(time.monotonic())
+                if domain is not None:
+                    return domain
+                if self._closed and self._unfinished == 0:
+                    return None
+                if not self._closed and self._unfinished < (self.maxsize or 1):
+                    return None  # Caller should put() more first
+            # Nothing due yet: either a server is out of tokens or lookups in flight may requeue
+            await asyncio.sleep(min(wait, 0.05) if wait is not None else 0.01)
+
+    def full(self):
+        with self._cond:
+            return bool(self.maxsize) and self._unfinished >= self.maxsize
+
+    def close(self):
+        """Marks the input as complete; workers stop once the rest is done."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def finished(self):
+        with self._cond:
+            return self._closed and self._unfinished == 0
+
+    def task_done(self):
+        with self._cond:
+            self._unfinished -= 1
+            self._cond.notify_all()  # Wakes join() and a put() waiting for room
+
+    def join(self):
+        with self._cond:
+            while self._unfinished > 0:
+                self._cond.wait()
+
+# Adaptive concurrency
+# How many lookups can usefully run at once depends on the servers and the
+# network, so the limit is found at run time. It starts in slow start,
+# doubling after every window of ADAPT_WINDOW lookups, and switches to AIMD
+# at the first decrease: one more per window from then on, halved as soon
+# as overload signals (timeouts and rate-limit refusals) pass
+# ADAPT_ERROR_RATE of a window. Other errors, such as a server dropping a
+# query or "No match", say nothing about load and do not shrink the limit.
+ADAPT_START = 10
+ADAPT_WINDOW = 20
+ADAPT_ERROR_RATE = 0.1
+DEFAULT_MAX_WORKERS = 32
+
+class ConcurrencyController:
+    """Slow start + AIMD limit on lookups in flight, shared by worker threads or the async dispatcher."""
+
+    def __init__(self, maximum, start=ADAPT_START, minimum=1, adaptive=True,
+                 window=ADAPT_WINDOW, error_rate=ADAPT_ERROR_RATE):
+        self.maximum = maximum
+        self.minimum = min(minimum, maximum)
+        self.adaptive = adaptive
+        self.window = window
+        self.error_rate = error_rate
+        self.limit = min(start, maximum) if adaptive else maximum
+        self.peak = self.limit
+        self.queries = 0
+        self.errors = 0
+        self.overloads = 0
+        self.active = 0
+        self.slow_start = adaptive
+        self._window_total = 0
+        self._window_overloads = 0
+        self._cond = threading.Condition()
+
+    def record(self, ok, overload=False):
+        """Counts one finished query and adjusts the limit.
+
+        overload marks a failure that suggests we are sending too much: a
+        timeout or a rate-limit refusal. Only those make the limit shrink.
+        """
+        with self._cond:
+            self.queries += 1
+            self._window_total += 1
+            if not ok:
+                self.errors += 1
+            if overload:
+                self.overloads += 1
+                self._window_overloads += 1
+            if not self.adaptive:
+                return
+            if self._window_overloads > self.error_rate * self.window:
+                # Multiplicative decrease, then start a fresh window
+                self.limit = max(self.minimum, self.limit // 2)
+                self.slow_start = False
+                self._window_total = self._window_overloads = 0
+            elif self._window_total >= self.window:
+                # Double while in slow start, additive increase afterwards
+                self.limit = min(self.maximum, self.limit * 2 if self.slow_start else self.limit + 1)
+                self.peak = max(self.peak, self.limit)
+                self._window_total = self._window_overloads = 0
+                self._cond.notify_all()
+
+    def acquire(self):
+        """Blocks a worker thread until it may run another lookup."""
+        with self._cond:
+            while self.active >= self.limit:
+                self._cond.wait()
+            self.active += 1
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify_all()
+
+    def report(self, seconds):
+        qps = self.queries / seconds if seconds else 0.0
+        return (f"Lookups: {self.queries} queries in {seconds:.1f}s ({qps:.1f} queries/sec), {self.errors} failed "
+                f"({self.overloads} timed out or rate limited); "
+                f"concurrency ended at {self.limit} (peak {self.peak}, max {self.maximum})")
+
+def lookup_registrar(domain_queue, results, cache=None, rate_limit_pause=DEFAULT_RATE_LIMIT_PAUSE,
+                     details=False, full_parse=False, controller=None, attempts=None, retries=3, throttled=None):
+    # attempts and throttled are shared by all workers: a retry may be picked up by a different thread
+    if attempts is None:
+        attempts = {}
+    if throttled is None:
+        throttled = {}
     while True:
+        if controller is not None:
+            controller.acquire()
         try:
-            domain = domain_queue.get(timeout=3)  # Timeout to exit thread gracefully
-            retries = 3
-            for attempt in range(retries):
-                try:
+            domain = domain_queue.get()
+            if domain is ServerScheduler.DONE:
+                break  # Shutdown sentinel: the input is closed and everything is finished
+            try:
+                if full_parse:
+                    # Full python-whois parse, for registries the fast parser doesn't know
                     w = whois.whois(domain)
+                    text = getattr(w, 'text', '') or ''
+                    record = make_record(domain, text, details)
                     registrar = None
 
                     # Check for common registrar labels
@@ -35,24 +451,958 @@ def lookup_registrar(domain_queue, results):
                                 registrar = value
                             break  # Found a registrar, no need to check other labels
 
-                    if not registrar:
-                        registrar = 'Not found'
-
-                    results.append({'domain': domain, 'registrar': registrar})
-                    break  # Success, break retry loop
-                except Exception as e:
-                    if attempt < retries - 1:
-                        wait_time = (2 ** attempt) + random.random()  # Exponential backoff + jitter
-                        print(f"Retrying {domain} in {wait_time:.2f} seconds after error: {e}")
-                        time.sleep(wait_time)
-                    else:
-                        results.append({'domain': domain, 'registrar': f'Error: {e}'})
-                        print("**FINAL OUTPUT**") # Print before final error result
-                finally:
-                    pass # No action needed here
+                    record['registrar'] = registrar or 'Not found'
+                else:
+                    # Raw text only; make_record() picks out the few fields we report
+                    text = whois.NICClient().whois_lookup(None, idna_encode(domain) or domain, 0,
+                                                          quiet=True, ignore_socket_errors=False)
+                    if not text or not text.strip():
+                        raise ConnectionError('Empty response')
+                    record = make_record(domain, text, details)
+
+                if record['registrar'] == 'Not found' and is_rate_limited(text):
+                    raise RateLimited(domain)
+
+                results.append(record)
+                if cache is not None:
+                    cache.put(domain, record['registrar'], text)
+                attempts.pop(domain, None)
+                throttled.pop(domain, None)
+                if controller is not None:
+                    controller.record(True)
+            except RateLimited:
+                if controller is not None:
+                    controller.record(False, overload=True)
+                throttled[domain] = throttled.get(domain, 0) + 1
+                if throttled[domain] < MAX_RATE_LIMITED:
+                    # Rest this server and let other registries' domains go first
+                    print(f"Rate limited by {server_key(domain)}; pausing it and requeueing {domain}", file=sys.stderr)
+                    domain_queue.requeue(domain, pause=rate_limit_pause)
+                else:
+                    throttled.pop(domain, None)
+                    attempts.pop(domain, None)
+                    results.append({'domain': domain, 'registrar': 'Error: rate limited'})
+                    if cache is not None:
+                        cache.put(domain, 'Error: rate limited')
+            except Exception as e:
+                if controller is not None:
+                    controller.record(False, overload=is_timeout(e))
+                attempt = attempts.get(domain, 0)
+                if attempt < retries - 1:
+                    attempts[domain] = attempt + 1
+                    wait_time = (2 ** attempt) + random.random()  # Exponential backoff + jitter
+                    print(f"Retrying {domain} in {wait_time:.2f} seconds after error: {e}", file=sys.stderr)
+                    # Back into the scheduler; this thread moves on instead of sleeping
+                    domain_queue.requeue(domain, delay=wait_time)
+                else:
+                    attempts.pop(domain, None)
+                    throttled.pop(domain, None)
+                    results.append({'domain': domain, 'registrar': f'Error: {e}'})
+                    if cache is not None:
+                        cache.put(domain, f'Error: {e}')
+                    print("**FINAL OUTPUT**", file=sys.stderr) # Print before final error result
             domain_queue.task_done()
-        except queue.Empty:
+        finally:
+            if controller is not None:
+                controller.release()
+
+# asyncio engine
+# Speaks the WHOIS protocol (RFC 3912) directly: open a TCP connection to
+# port 43, send the query and read until the server closes the connection.
+# Hundreds of queries can be in flight at once, and retry backoff does not
+# tie up a thread.
+
+def extract_registrar(text):
+    """Returns the registrar named in a raw WHOIS response, or None."""
+    for match in REGISTRAR_RE.finditer(text):
+        value = match.group(1).strip()
+        if not value:
+            # Value on the next non-empty line
+            following = text[match.end():].lstrip('\r\n').splitlines()
+            value = following[0].strip() if following else ''
+            # e.g. .eu puts "Name: ..." under the "Registrar:" heading
+            value = NAME_PREFIX_RE.sub('', value)
+        if value:
+            return value
+    return None
+
+def extract_referral(text):
+    """Returns the next WHOIS server a response points to, or None."""
+    match = REFERRAL_RE.search(text)
+    if not match:
+        return None
+    server = match.group(1).strip().lower()
+    # Some registries write the server as a URL
+    server = re.sub(r'^[a-z]+://', '', server).rstrip('/')
+    return server or None
+
+# Fast response parser
+# Pulls only the fields we report out of the raw text: one regex pass over
+# the "Label: value" lines (and JPRS-style "[Label] value" lines) plus a
+# table lookup per label, instead of building python-whois's full
+# WhoisEntry for every domain.
+DETAIL_FIELDS = ['created', 'expires', 'name_servers']
+
+FIELD_LINE_RE = re.compile(r'^[ \t]*(?:\[([^\]\n]{1,40})\][ \t]*|([A-Za-z][A-Za-z0-9 ./_()-]{0,40}?)[ \t]*:[ \t]*)([^\r\n]*?)[ \t\r]*$',
+                           re.MULTILINE)
+
+FIELD_LABELS = {}
+for _field, _labels in {
+    'registrar': ['registrar', 'sponsoring registrar', 'registrar name'],
+    'created': ['creation date', 'created', 'created on', 'created date', 'registered', 'registered on',
+                'registration date', 'registration time', 'domain registration date', 'domain record activated'],
+    'expires': ['registry expiry date', 'registrar registration expiration date', 'expiry date', 'expiration date',
+                'expires', 'expires on', 'expire date', 'expiration time', 'paid-till', 'renewal date',
+                'domain expiration date', 'record expires on'],
+    'name_servers': ['name server', 'name servers', 'nameserver', 'nameservers', 'nserver', 'domain nameservers'],
+}.items():
+    for _label in _labels:
+        FIELD_LABELS[_label] = _field
+
+def _following_lines(text, pos):
+    """The indented block after an empty "Label:" line, up to the next blank line."""
+    lines = []
+    for line in text[pos:].lstrip('\r\n').splitlines():
+        line = line.strip()
+        if not line:
+            break
+        lines.append(line)
+    return lines
+
+def parse_whois(text, fields=None):
+    """Returns {field: value} for the requested fields (default: registrar and DETAIL_FIELDS).
+
+    Dates are returned as written by the registry; name_servers is a list.
+    """
+    wanted = set(fields or ['registrar'] + DETAIL_FIELDS)
+    found = {}
+    for match in FIELD_LINE_RE.finditer(text):
+        field = FIELD_LABELS.get((match.group(1) or match.group(2)).strip().lower())
+        if field not in wanted:
+            continue
+        value = match.group(3).strip()
+        if field == 'name_servers':
+            names = found.setdefault('name_servers', [])
+            for line in [value] if value else _following_lines(text, match.end()):
+                name = line.split()[0].lower().rstrip('.')
+                if name not in names:
+                    names.append(name)
+        elif field not in found:
+            if not value:
+                following = _following_lines(text, match.end())
+                value = NAME_PREFIX_RE.sub('', following[0]) if following else ''
+            if value:
+                found[field] = value
+                if 'name_servers' not in wanted and len(found) == len(wanted):
+                    break  # Nothing left to look for
+    return found
+
+def format_text(record):
+    line = f"Domain: {record['domain']}, Registrar: {record['registrar']}"
+    if 'created' in record:
+        line += f", Created: {record['created']}, Expires: {record['expires']}, Name servers: {record['name_servers']}"
+    return line
+
+def make_record(domain, text, details=False):
+    """Builds the result record for a raw WHOIS response."""
+    if not details:
+        return {'domain': domain, 'registrar': extract_registrar(text) or 'Not found'}
+    fields = parse_whois(text)
+    return {'domain': domain, 'registrar': fields.get('registrar') or 'Not found',
+            'created': fields.get('created', ''), 'expires': fields.get('expires', ''),
+            'name_servers': ' '.join(fields.get('name_servers', []))}
+
+def parse_server(value, default_port=WHOIS_PORT):
+    """Splits "host" or "host:port" into (host, port)."""
+    host, sep, port = value.rpartition(':')
+    if sep and port.isdigit():
+        return host, int(port)
+    return value, default_port
+
+# Server discovery
+# Which server answers for a TLD rarely changes, so the IANA answer is
+# remembered in a TLD -> server map (persisted as JSON), and the registrar
+# server a registry referred a domain to is remembered too. Repeat lookups
+# then go straight to the right server. WHOIS servers close the connection
+# after every answer (RFC 3912), so TCP connections cannot be reused; the
+# resolved addresses are, which saves a DNS round trip per hop.
+DEFAULT_SERVERS_PATH = 'whois_servers.json'
+REFERRAL_MEMORY = 10000   # Domains whose registrar server is remembered
+ADDRESS_TTL = 300         # Seconds a resolved address is reused
+TIMING_SAMPLES = 10000    # Per-hop samples kept for percentiles
+
+class ServerDirectory:
+    """TLD -> WHOIS server map and per-domain referral cache, optionally saved to a JSON file."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.tlds = {}        # tld -> "host:port" learned from IANA
+        self.referrals = {}   # domain -> "host:port" of the registrar server (insertion ordered)
+        self._discovering = {}  # tld -> task, so concurrent lookups share one IANA query
+        if path:
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+                self.tlds = dict(data.get('tlds', {}))
+                self.referrals = dict(data.get('referrals', {}))
+            except FileNotFoundError:
+                pass
+            except (ValueError, AttributeError) as e:
+                print(f"Warning: ignoring unreadable {path} ({e})", file=sys.stderr)
+
+    def tld_server(self, tld):
+        """Returns (host, port) for a TLD if known, else None."""
+        server = self.tlds.get(tld) or TLD_SERVERS.get(tld)
+        return parse_server(server) if server else None
+
+    def learn_tld(self, tld, server):
+        self.tlds[tld] = f'{server[0]}:{server[1]}'
+
+    async def discover(self, tld, ask_iana):
+        """Returns ((host, port), shared) for tld, running ask_iana() once however many lookups wait on it."""
+        task = self._discovering.get(tld)
+        shared = task is not None
+        if not shared:
+            task = self._discovering[tld] = asyncio.ensure_future(self._discover(tld, ask_iana))
+            task.add_done_callback(lambda t: self._discovering.pop(tld, None))
+        # The query runs in its own task and every caller waits through a shield,
+        # so one caller timing out doesn't cancel it for the others
+        return await asyncio.shield(task), shared
+
+    async def _discover(self, tld, ask_iana):
+        server = await ask_iana()
+        self.learn_tld(tld, server)
+        return server
+
+    def forget_tld(self, tld):
+        self.tlds.pop(tld, None)
+
+    def referral(self, domain):
+        server = self.referrals.get(domain)
+        return parse_server(server) if server else None
+
+    def learn_referral(self, domain, server):
+        self.referrals.pop(domain, None)
+        self.referrals[domain] = f'{server[0]}:{server[1]}'
+        if len(self.referrals) > REFERRAL_MEMORY:
+            del self.referrals[next(iter(self.referrals))]  # Forget the oldest
+
+    def forget_referral(self, domain):
+        self.referrals.pop(domain, None)
+
+    def save(self):
+        """Writes the map atomically, so a crash never leaves a half-written file."""
+        if not self.path:
+            return
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'tlds': self.tlds, 'referrals': self.referrals}, f, indent=1)
+        os.replace(tmp, self.path)
+
+class AddressCache:
+    """Reuses resolved WHOIS server addresses for ADDRESS_TTL seconds."""
+
+    def __init__(self, ttl=ADDRESS_TTL):
+        self.ttl = ttl
+        self.resolved = 0
+        self.reused = 0
+        self._addresses = {}   # (host, port) -> (expires, [ip, ...])
+        self._pending = {}     # (host, port) -> task, so concurrent lookups share one resolution
+
+    async def resolve(self, host, port):
+        key = (host, port)
+        entry = self._addresses.get(key)
+        if entry and entry[0] > time.monotonic():
+            self.reused += 1
+            return entry[1]
+        task = self._pending.get(key)
+        if task is not None:
+            self.reused += 1
+        else:
+            task = self._pending[key] = asyncio.ensure_future(self._resolve(key))
+            task.add_done_callback(lambda t: self._pending.pop(key, None))
+        # Shielded like ServerDirectory.discover: a caller's timeout must not cancel the shared resolution
+        return await asyncio.shield(task)
+
+    async def _resolve(self, key):
+        infos = await asyncio.get_running_loop().getaddrinfo(key[0], key[1], type=socket.SOCK_STREAM)
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        self._addresses[key] = (time.monotonic() + self.ttl, addresses)
+        self.resolved += 1
+        return addresses
+
+    def forget(self, host, port):
+        self._addresses.pop((host, port), None)
+
+class HopTimings:
+    """Per-hop latency: DNS, connect and response time for each kind of hop."""
+
+    KINDS = ['iana', 'registry', 'registrar']
+
+    def __init__(self):
+        self.hops = {kind: {'count': 0, 'dns': 0.0, 'connect': 0.0, 'response': 0.0, 'totals': []}
+                     for kind in self.KINDS}
+        self.skipped = {'iana': 0, 'registry': 0}
+
+    def add(self, kind, dns, connect, response):
+        hop = self.hops[kind]
+        hop['count'] += 1
+        hop['dns'] += dns
+        hop['connect'] += connect
+        hop['response'] += response
+        total = dns + connect + response
+        if len(hop['totals']) < TIMING_SAMPLES:
+            hop['totals'].append(total)
+        else:
+            # Reservoir sampling keeps memory flat on long runs
+            i = random.randrange(hop['count'])
+            if i < TIMING_SAMPLES:
+                hop['totals'][i] = total
+
+    def skip(self, kind):
+        self.skipped[kind] += 1
+
+    def report(self, addresses=None):
+        lines = [f"{'Per-hop timings (ms)':<22}{'hops':>8}{'dns':>9}{'connect':>9}{'response':>10}{'p50':>9}{'p95':>9}"]
+        for kind in self.KINDS:
+            hop = self.hops[kind]
+            n = hop['count']
+            if not n:
+                continue
+            totals = sorted(hop['totals'])
+            p50 = totals[len(totals) // 2]
+            p95 = totals[min(len(totals) - 1, int(len(totals) * 0.95))]
+            lines.append(f"  {kind:<20}{n:>8}{hop['dns'] / n * 1000:>9.1f}{hop['connect'] / n * 1000:>9.1f}"
+                         f"{hop['response'] / n * 1000:>10.1f}{p50 * 1000:>9.1f}{p95 * 1000:>9.1f}")
+        lines.append(f"Discovery hops skipped: {self.skipped['iana']} IANA (TLD map or shared query), "
+                     f"{self.skipped['registry']} registry (referral cache)")
+        if addresses is not None:
+            lines.append(f"DNS: {addresses.resolved} resolutions, {addresses.reused} reused")
+        return lines
+
+async def whois_query(host, query, port=WHOIS_PORT, timeout=10, addresses=None, timing=None):
+    """Sends one WHOIS query and returns the decoded response.
+
+    With an AddressCache the server's address is resolved once and reused.
+    timing, if given, is filled with 'dns', 'connect' and 'response' seconds.
+    """
+    async def _query():
+        start = time.perf_counter()
+        targets = await addresses.resolve(host, port) if addresses is not None else [host]
+        resolved = time.perf_counter()
+        for i, target in enumerate(targets):
+            try:
+                reader, writer = await asyncio.open_connection(target, port)
+                break
+            except OSError:
+                if i == len(targets) - 1:
+                    if addresses is not None:
+                        addresses.forget(host, port)  # Maybe the server moved
+                    raise
+        connected = time.perf_counter()
+        try:
+            writer.write(query.encode('idna' if not query.isascii() else 'ascii') + b'\r\n')
+            await writer.drain()
+            data = await reader.read()  # The server closes the connection when it is done
+        finally:
+            writer.close()
+        if timing is not None:
+            timing.update(dns=resolved - start, connect=connected - resolved,
+                          response=time.perf_counter() - connected)
+        return data
+
+    data = await asyncio.wait_for(_query(), timeout)
+    if not data.strip():
+        raise ConnectionError(f"Empty response from {host}")
+    return data.decode('utf-8', errors='replace')
+
+async def whois_lookup_raw(domain, server=None, timeout=10, directory=None, addresses=None, timings=None):
+    """Follows IANA -> registry -> registrar referrals and returns the last response.
+
+    server is a (host, port) pair to use instead of asking IANA. With a
+    ServerDirectory, known TLD servers and registrar referrals skip those hops.
+    """
+    async def query(kind, host, port, text):
+        timing = {} if timings is not None else None
+        response = await whois_query(host, text, port, timeout, addresses, timing)
+        if timing:
+            timings.add(kind, timing['dns'], timing['connect'], timing['response'])
+        return response
+
+    tld = domain.rsplit('.', 1)[-1]
+    if server is None and directory is not None:
+        # A registrar server that answered for this domain before: skip IANA and the registry
+        cached = directory.referral(domain)
+        if cached is not None:
+            try:
+                text = await query('registrar', cached[0], cached[1], domain)
+                if extract_registrar(text):
+                    if timings is not None:
+                        timings.skip('iana')
+                        timings.skip('registry')
+                    return text
+            except (OSError, asyncio.TimeoutError):
+                pass
+            directory.forget_referral(domain)  # Stale; do the full walk
+
+    learned = False
+    if server is None:
+        server = directory.tld_server(tld) if directory is not None else None
+        if server is not None:
+            learned = True
+            if timings is not None:
+                timings.skip('iana')
+        else:
+            async def ask_iana():
+                iana = await query('iana', IANA_WHOIS_SERVER, WHOIS_PORT, tld)
+                referral = extract_referral(iana)
+                if not referral:
+                    raise LookupError(f"No WHOIS server known for .{tld}")
+                return parse_server(referral)
+
+            if directory is not None:
+                server, shared = await directory.discover(tld, ask_iana)
+                if shared and timings is not None:
+                    timings.skip('iana')
+            else:
+                server = await ask_iana()
+
+    seen = set()
+    text = ''
+    kind = 'registry'
+    for _ in range(MAX_REFERRALS + 1):
+        seen.add(server)
+        try:
+            text = await query(kind, server[0], server[1], domain)
+        except (OSError, asyncio.TimeoutError):
+            if learned and kind == 'registry' and directory is not None:
+                directory.forget_tld(tld)  # Rediscover through IANA on the retry
+            raise
+        if extract_registrar(text):
+            if kind == 'registrar' and directory is not None:
+                directory.learn_referral(domain, server)
             break
+        referral = extract_referral(text)
+        if not referral:
+            break
+        server = parse_server(referral, server[1])
+        if server in seen:
+            break
+        kind = 'registrar'
+    return text
+
+async def async_lookup_once(domain, server=None, timeout=10, cache=None, details=False,
+                            directory=None, addresses=None, timings=None):
+    """Looks up one domain, returning a {'domain', 'registrar'} record (plus DETAIL_FIELDS with details).
+
+    Raises RateLimited if the server refused the query.
+    """
+    text = await whois_lookup_raw(domain, server, timeout, directory, addresses, timings)
+    record = make_record(domain, text, details)
+    if record['registrar'] == 'Not found' and is_rate_limited(text):
+        raise RateLimited(text.strip().splitlines()[0] if text.strip() else 'rate limited')
+    if cache is not None:
+        cache.put(domain, record['registrar'], text)
+    return record
+
+async def run_async_lookups(domains, concurrency=100, server=None, timeout=10, retries=3, cache=None,
+                            scheduler=None, rate_limit_pause=DEFAULT_RATE_LIMIT_PAUSE, on_result=None, details=False,
+                            directory=None, addresses=None, timings=None, controller=None):
+    """Looks up all domains with at most `concurrency` queries in flight.
+
+    With a ConcurrencyController the limit is its (adaptive) limit instead.
+
+    Domains are handed out by a ServerScheduler, so each WHOIS server sees at
+    most its configured rate. Failed lookups go back to the scheduler with
+    exponential backoff instead of sleeping. `domains` may be any iterable;
+    it is read only as fast as the scheduler has room. Each result is passed
+    to on_result as it completes; without one they are collected and returned.
+    """
+    if scheduler is None:
+        scheduler = ServerScheduler(key=(lambda d: server[0]) if server else server_key)
+    results = []
+    if on_result is None:
+        on_result = results.append
+    domains = iter(domains)
+
+    def feed():
+        # Top the scheduler up to its window from the (possibly huge) input
+        while not scheduler.full():
+            domain = next(domains, None)
+            if domain is None:
+                scheduler.close()
+                return
+            scheduler.put(domain)
+
+    attempts = {}
+    throttled = {}
+    if controller is None:
+        controller = ConcurrencyController(concurrency, adaptive=False)
+    inflight = 0
+    slot_free = asyncio.Event()
+    if addresses is None:
+        addresses = AddressCache()
+
+    def fail(domain, error):
+        if cache is not None:
+            cache.put(domain, f'Error: {error}')
+        on_result({'domain': domain, 'registrar': f'Error: {error}'})
+
+    async def lookup(domain):
+        nonlocal inflight
+        finished = True
+        try:
+            on_result(await async_lookup_once(domain, server, timeout, cache, details,
+                                              directory, addresses, timings))
+            controller.record(True)
+        except RateLimited as e:
+            controller.record(False, overload=True)
+            throttled[domain] = throttled.get(domain, 0) + 1
+            if throttled[domain] < MAX_RATE_LIMITED:
+                print(f"Rate limited by {scheduler.key(domain)}; pausing it for {rate_limit_pause}s "
+                      f"and requeueing {domain}", file=sys.stderr)
+                scheduler.requeue(domain, pause=rate_limit_pause)
+                finished = False
+            else:
+                fail(domain, f'rate limited ({e})')
+        except Exception as e:
+            controller.record(False, overload=is_timeout(e))
+            error = e if str(e) else type(e).__name__
+            attempt = attempts.get(domain, 0)
+            if attempt < retries - 1:
+                attempts[domain] = attempt + 1
+                wait_time = (2 ** attempt) + random.random()  # Exponential backoff + jitter
+                print(f"Retrying {domain} in {wait_time:.2f} seconds after error: {error}", file=sys.stderr)
+                scheduler.requeue(domain, delay=wait_time)
+                finished = False
+            else:
+                fail(domain, error)
+        finally:
+            if finished:
+                # Keep per-domain state bounded by the number of domains in flight
+                attempts.pop(domain, None)
+                throttled.pop(domain, None)
+            inflight -= 1
+            slot_free.set()
+            scheduler.task_done()
+
+    tasks = set()
+    while True:
+        while inflight >= controller.limit:
+            slot_free.clear()
+            await slot_free.wait()
+        feed()
+        domain = await scheduler.aget()
+        if domain is None:
+            if scheduler.finished():
+                break
+            continue  # Room in the window: read more input
+        inflight += 1
+        task = asyncio.create_task(lookup(domain))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    await asyncio.gather(*tasks)
+    return results
+
+# Streaming input and output
+# With --stream the domain file is read lazily and each result is written as
+# soon as it arrives, so memory stays flat however long the list is.
+STREAM_WINDOW = 10000        # Domains read ahead of the lookups
+WRITER_QUEUE_SIZE = 10000    # Results waiting for the writer thread
+FLUSH_EVERY = 100            # Rows between flushes
+FLUSH_INTERVAL = 1.0         # Seconds between flushes when results trickle in
+
+def iter_domains(f):
+    """Yields domains from the first column of a CSV file, one row at a time."""
+    for row in csv.reader(f):
+        if row and row[0].strip():
+            yield row[0].strip()
+
+def filter_cached(domains, cache, emit, cache_only=False, details=False):
+    """Yields the domains that need a network lookup; cached answers go straight to emit."""
+    for domain in domains:
+        hit = cache.get(domain, with_raw=details)
+        if hit is not None:
+            if details:
+                registrar, raw = hit
+                record = make_record(domain, raw, True) if raw else {'domain': domain}
+                record['registrar'] = registrar
+            else:
+                record = {'domain': domain, 'registrar': hit}
+            emit(record)
+        elif cache_only:
+            emit({'domain': domain, 'registrar': 'Not in cache'})
+        else:
+            yield domain
+
+class ResultWriter:
+    """Writes results from any thread through a single writer thread.
+
+    csv writes rows under a header, json writes JSON Lines (one object per
+    line) and text writes "Domain: ..., Registrar: ..." lines. The queue in
+    front of the writer is bounded, so a slow disk slows the lookups down
+    instead of piling results up in memory.
+    """
+
+    _STOP = object()
+
+    def __init__(self, out, fmt='csv', flush_every=FLUSH_EVERY, flush_interval=FLUSH_INTERVAL,
+                 header=True, journal=None, fields=('domain', 'registrar')):
+        self.out = out
+        self.fmt = fmt
+        self.header = header
+        self.journal = journal
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.count = 0
+        self._queue = queue.Queue(maxsize=WRITER_QUEUE_SIZE)
+        self._csv = csv.DictWriter(out, fieldnames=list(fields), extrasaction='ignore') if fmt == 'csv' else None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def append(self, record):
+        """Queues one result; named like list.append so it can stand in for a results list."""
+        self._queue.put(record)
+
+    def _write(self, record):
+        if self._csv is not None:
+            self._csv.writerow(record)
+        elif self.fmt == 'json':
+            self.out.write(json.dumps(record) + '\n')
+        else:
+            self.out.write(format_text(record) + '\n')
+        if self.journal is not None:
+            self.journal.record(record)
+
+    def _flush(self):
+        self.out.flush()
+        if self.journal is not None:
+            # Rows must be on disk before the journal says they are done
+            try:
+                os.fsync(self.out.fileno())
+            except (OSError, ValueError):
+                pass  # stdout may be a pipe or terminal
+            self.journal.sync()
+
+    def _run(self):
+        if self._csv is not None and self.header:
+            self._csv.writeheader()
+        last_flush = time.monotonic()
+        unflushed = 0
+        while True:
+            try:
+                record = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                record = None
+            if record is self._STOP:
+                break
+            if record is not None:
+                self._write(record)
+                self.count += 1
+                unflushed += 1
+            now = time.monotonic()
+            if unflushed and (unflushed >= self.flush_every or now - last_flush >= self.flush_interval):
+                self._flush()
+                last_flush = now
+                unflushed = 0
+        self._flush()
+
+    def close(self):
+        """Writes everything still queued and stops the writer thread."""
+        self._queue.put(self._STOP)
+        self._thread.join()
+
+# Checkpoint journal
+# Every finished domain is appended to a JSON Lines journal next to the
+# output. Records are buffered and fsynced in batches, so checkpointing costs
+# one disk sync per batch rather than one per domain. --resume reads the
+# journal back and skips what is already done.
+JOURNAL_SYNC_EVERY = 100
+JOURNAL_SYNC_INTERVAL = 1.0
+
+def load_journal(path, records=None):
+    """Returns the set of normalized domains a journal has a final result for.
+
+    Only the set is kept, so resuming a huge streamed run stays small. Pass a
+    records dict to also collect the final records themselves, which the
+    non-stream output needs to rebuild the file. A torn last line is ignored.
+    """
+    finished = set()
+    try:
+        with open(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # Crashed mid-write
+                key = normalize_domain(record['domain'])
+                if is_finished(record):
+                    finished.add(key)
+                    if records is not None:
+                        records[key] = record
+                else:
+                    finished.discard(key)
+                    if records is not None:
+                        records.pop(key, None)
+    except FileNotFoundError:
+        pass
+    return finished
+
+def is_finished(record):
+    """Errors are retried on resume; every other answer is final."""
+    return not str(record['registrar']).startswith('Error')
+
+class Journal:
+    """Append-only record of finished domains with batched fsync.
+
+    append() mirrors list.append so a Journal can wrap the results list: the
+    record goes to `target` and into the journal. The stream writer instead
+    calls record() and sync() itself, after the output is on disk.
+    """
+
+    def __init__(self, path, target=None, resume=False,
+                 sync_every=JOURNAL_SYNC_EVERY, sync_interval=JOURNAL_SYNC_INTERVAL):
+        self.path = path
+        self.target = target
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self._buffer = []
+        self._last_sync = time.monotonic()
+        self._lock = threading.Lock()
+        self._file = open(path, 'a' if resume else 'w')
+        if resume and self._file.tell():
+            with open(path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    self._file.write('\n')  # Don't glue the next record onto a torn line
+
+    def record(self, record):
+        with self._lock:
+            self._buffer.append(json.dumps(record, default=str) + '\n')
+
+    def sync(self):
+        """Writes buffered records and fsyncs the journal."""
+        with self._lock:
+            if self._buffer:
+                self._file.write(''.join(self._buffer))
+                self._buffer.clear()
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            self._last_sync = time.monotonic()
+
+    def append(self, record):
+        self.target.append(record)
+        self.record(record)
+        if len(self._buffer) >= self.sync_every or time.monotonic() - self._last_sync >= self.sync_interval:
+            self.sync()
+
+    def __len__(self):
+        return len(self.target)
+
+    def __iter__(self):
+        return iter(self.target)
+
+    def close(self):
+        self.sync()
+        self._file.close()
+
+def skip_finished(domains, finished):
+    """Yields domains the journal has no final result for."""
+    for domain in domains:
+        if normalize_domain(domain) not in finished:
+            yield domain
+
+def keep_finished_rows(path, fmt, finished):
+    """Rewrites a streamed output, keeping only rows the journal has a final result for.
+
+    Error rows, and rows written after the last checkpoint, are looked up
+    again on resume; dropping them first leaves one row per domain. Returns
+    the number of rows dropped.
+    """
+    def keep(domain):
+        return bool(domain) and normalize_domain(domain) in finished
+
+    tmp = f'{path}.tmp'
+    dropped = 0
+    with open(path, newline='') as src, open(tmp, 'w', newline='') as dst:
+        if fmt == 'csv':
+            reader = csv.reader(src)
+            header = next(reader, None)
+            out = csv.writer(dst)
+            if header:
+                out.writerow(header)
+            column = header.index('domain') if header and 'domain' in header else 0
+            for row in reader:
+                if len(row) > column and keep(row[column]):
+                    out.writerow(row)
+                else:
+                    dropped += 1
+        else:
+            for line in src:
+                domain = None
+                if fmt == 'json':
+                    try:
+                        domain = json.loads(line)['domain']
+                    except (ValueError, KeyError, TypeError):
+                        pass  # Torn line from a crash
+                elif line.startswith('Domain: '):
+                    domain = line[len('Domain: '):].split(', Registrar: ', 1)[0]
+                if line.endswith('\n') and keep(domain):
+                    dst.write(line)
+                else:
+                    dropped += 1
+        dst.flush()
+        os.fsync(dst.fileno())
+    os.replace(tmp, path)
+    return dropped
+
+# Input normalization and deduplication
+# Lists often hold many hostnames under one registrable domain
+# (mail.example.com, www.example.com) and WHOIS only knows about the
+# registrable domain anyway. Names are lowercased, IDNA-encoded and reduced
+# with the public suffix list, so each registrable domain is looked up once
+# and the answer is copied to every input row that maps to it.
+PSL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'public_suffix_list.dat')
+DEDUP_MEMORY = 100000  # Finished registrable domains remembered for later duplicates
+
+def idna_encode(name):
+    """Returns a lowercased ASCII (punycode) name, or None if it can't be encoded."""
+    name = name.strip().lower().rstrip('.')
+    if not name or name.isascii():
+        return name or None
+    try:
+        return name.encode('idna').decode('ascii')
+    except UnicodeError:
+        return None
+
+class SuffixTrie:
+    """Public suffix rules compiled into a trie keyed by label, TLD first.
+
+    Rule ends are marked with '$', exception rules (!www.ck) with '!', and
+    wildcard rules (*.ck) are a '*' child. Only the ICANN section is used:
+    WHOIS answers for registry-level registrations, not for private suffixes
+    such as blogspot.com.
+    """
+
+    def __init__(self, rules=()):
+        self.root = {}
+        self.rules = 0
+        for rule in rules:
+            self.add(rule)
+
+    @classmethod
+    def from_file(cls, path=PSL_PATH):
+        rules = []
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith('// ===END ICANN DOMAINS==='):
+                    break
+                if line and not line.startswith('//'):
+                    rules.append(line.split()[0])
+        return cls(rules)
+
+    def add(self, rule):
+        exception = rule.startswith('!')
+        labels = []
+        for label in rule.lstrip('!').split('.'):
+            label = label if label == '*' else idna_encode(label)
+            if label is None:
+                return
+            labels.append(label)
+        node = self.root
+        for label in reversed(labels):
+            node = node.setdefault(label, {})
+        node['!' if exception else '$'] = True
+        self.rules += 1
+
+    def suffix_length(self, labels):
+        """Number of trailing labels that form the public suffix (at least 1)."""
+        best = 1  # Unlisted TLDs: the TLD itself is the suffix
+        frontier = [self.root]
+        for depth, label in enumerate(reversed(labels), 1):
+            matches = []
+            for node in frontier:
+                child = node.get(label)
+                if child is not None:
+                    if '!' in child:
+                        return depth - 1  # Exception rules win outright
+                    matches.append(child)
+                wildcard = node.get('*')
+                if wildcard is not None:
+                    matches.append(wildcard)
+            if not matches:
+                break
+            if any('$' in node for node in matches):
+                best = depth
+            frontier = matches
+        return best
+
+    def registrable(self, domain):
+        """Returns the registrable domain (public suffix + one label), or None."""
+        labels = domain.split('.')
+        if '' in labels:
+            return None
+        n = self.suffix_length(labels) + 1
+        return '.'.join(labels[-n:]) if len(labels) >= n else None
+
+class Deduplicator:
+    """Sits between the input and the lookups and between the lookups and the output.
+
+    feed() yields each registrable domain once; append() takes the lookup
+    result for it and emits one record per original input row.
+    """
+
+    def __init__(self, emit, trie, memory=DEDUP_MEMORY):
+        self.emit = emit
+        self.trie = trie
+        self.memory = memory
+        self.rows = 0
+        self.lookups = 0
+        self.invalid = 0
+        self._waiting = {}   # registrable domain -> input rows waiting for it
+        self._done = {}      # recently finished registrable domain -> record (insertion ordered)
+        self._lock = threading.Lock()
+
+    def key(self, name):
+        name = idna_encode(name)
+        return self.trie.registrable(name) if name else None
+
+    def feed(self, domains):
+        for original in domains:
+            key = self.key(original)
+            with self._lock:
+                self.rows += 1
+                if key is None:
+                    self.invalid += 1
+                    record = {'domain': original, 'registrar': 'Error: not a registrable domain'}
+                elif key in self._waiting:
+                    self._waiting[key].append(original)
+                    continue
+                elif key in self._done:
+                    record = dict(self._done[key], domain=original)
+                else:
+                    self._waiting[key] = [original]
+                    self.lookups += 1
+                    record = None
+            if record is None:
+                yield key
+            else:
+                self.emit(record)
+
+    def append(self, record):
+        key = record['domain']
+        with self._lock:
+            originals = self._waiting.pop(key, [key])
+            self._done[key] = record
+            if len(self._done) > self.memory:
+                del self._done[next(iter(self._done))]  # Forget the oldest
+        for original in originals:
+            self.emit(dict(record, domain=original))
+
+    @property
+    def saved(self):
+        return self.rows - self.lookups - self.invalid
 
 def main():
     parser = argparse.ArgumentParser(description='Whois Lookup Script')
@@ -60,20 +1410,90 @@ def main():
     parser.add_argument('--file', help='Path to a CSV file containing a list of domains')
     parser.add_argument('--format', choices=['text', 'csv', 'json'], default='csv', help='Output format (text, csv, json)')
     parser.add_argument('--output', help='Output file path. If not specified, prints to stdout.')
+    parser.add_argument('--engine', choices=['threads', 'async'], default='threads',
+                        help='threads: python-whois on a pool of worker threads; async: direct port-43 queries with asyncio')
+    parser.add_argument('--concurrency', type=int, default=100,
+                        help='Most queries in flight with --engine async, unless --max-workers is given (default: 100)')
+    parser.add_argument('--max-workers', type=int,
+                        help=f'Upper bound for the adaptive concurrency: worker threads with --engine threads '
+                             f'(default: {DEFAULT_MAX_WORKERS}), queries in flight with --engine async')
+    parser.add_argument('--no-adaptive', action='store_true',
+                        help='Run at the full --max-workers/--concurrency from the start instead of adapting')
+    parser.add_argument('--timeout', type=float, default=10, help='Per-query timeout in seconds with --engine async (default: 10)')
+    parser.add_argument('--whois-server', help='Send every query to this HOST[:PORT] instead of asking IANA (--engine async)')
+    parser.add_argument('--cache', action='store_true', help='Reuse and store results in the on-disk cache')
+    parser.add_argument('--cache-file', default=DEFAULT_CACHE_PATH, help=f'Cache database (default: {DEFAULT_CACHE_PATH})')
+    parser.add_argument('--cache-ttl', type=float, default=DEFAULT_CACHE_TTL,
+                        help='Seconds a cached registrar stays valid (default: 7 days)')
+    parser.add_argument('--negative-ttl', type=float, default=DEFAULT_NEGATIVE_TTL,
+                        help='Seconds a cached "Not found" or error result stays valid (default: 1 hour)')
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE,
+                        help=f'Queries per second sent to each WHOIS server (default: {DEFAULT_RATE})')
+    parser.add_argument('--burst', type=int, default=DEFAULT_BURST,
+                        help=f'Queries a server may receive back to back (default: {DEFAULT_BURST})')
+    parser.add_argument('--server-rate', action='append', default=[], metavar='SERVER=RATE',
+                        help='Per-server rate override; SERVER is a WHOIS host or a TLD (repeatable)')
+    parser.add_argument('--rate-limit-pause', type=float, default=DEFAULT_RATE_LIMIT_PAUSE,
+                        help=f'Seconds to rest a server that reports "rate limit exceeded" (default: {DEFAULT_RATE_LIMIT_PAUSE})')
+    parser.add_argument('--stream', action='store_true',
+                        help='Read --file lazily and write each result as it completes (csv rows, JSON Lines or text lines)')
+    parser.add_argument('--window', type=int, default=STREAM_WINDOW,
+                        help=f'Domains read ahead of the lookups with --stream (default: {STREAM_WINDOW})')
+    parser.add_argument('--journal', help='Checkpoint journal path (default: OUTPUT.journal when --output is given)')
+    parser.add_argument('--resume', action='store_true',
+                        help='Skip domains the journal already has results for and add to the existing output')
+    parser.add_argument('--no-dedup', action='store_true',
+                        help='Query every input name as given instead of once per registrable domain')
+    parser.add_argument('--details', action='store_true',
+                        help='Also report creation date, expiry date and name servers')
+    parser.add_argument('--full-parse', action='store_true',
+                        help='Use python-whois\'s full response parser instead of the fast one (--engine threads)')
+    parser.add_argument('--servers-file',
+                        help=f'JSON file remembering TLD servers and registrar referrals (--engine async; '
+                             f'default: {DEFAULT_SERVERS_PATH} when the cache is on)')
+    parser.add_argument('--timings', action='store_true',
+                        help='Report DNS, connect and response time per hop (--engine async)')
+    cache_mode = parser.add_mutually_exclusive_group()
+    cache_mode.add_argument('--cache-only', action='store_true', help='Answer from the cache only; never query the network (implies --cache)')
+    cache_mode.add_argument('--refresh', action='store_true', help='Ignore cached results, query again and update the cache (implies --cache)')
 
     args = parser.parse_args()
 
+    # Rates are checked up front, before any output or journal file is opened
+    if not args.rate > 0 or args.burst < 1:
+        print(f"Error: --rate must be above 0 and --burst at least 1, got --rate {args.rate:g} --burst {args.burst}")
+        print("**FINAL OUTPUT**")
+        return
+    server_rates = {}
+    for item in args.server_rate:
+        name, sep, rate = item.partition('=')
+        try:
+            server_rates[name.strip().lower()] = float(rate)
+        except ValueError:
+            print(f"Error: --server-rate expects SERVER=RATE, got {item!r}")
+            print("**FINAL OUTPUT**")
+            return
+        if not server_rates[name.strip().lower()] > 0:
+            print(f"Error: --server-rate needs a rate above 0, got {item!r}")
+            print("**FINAL OUTPUT**")
+            return
+
     domains = []
+    domain_file = None
 
     # 1. Get domains from command line or file
     if args.domains:
         domains = args.domains
     elif args.file:
         try:
-            domains_df = pd.read_csv(args.file, header=None, names=['domain'], dtype={'domain': str})
-            domains_df = domains_df.dropna()  # Remove rows with NaN values
-            domains = domains_df['domain'].tolist()
-            domains = [d.strip() for d in domains] # Remove whitespace
+            if args.stream:
+                domain_file = open(args.file, newline='')
+                domains = iter_domains(domain_file)
+            else:
+                domains_df = pd.read_csv(args.file, header=None, names=['domain'], dtype={'domain': str})
+                domains_df = domains_df.dropna()  # Remove rows with NaN values
+                domains = domains_df['domain'].tolist()
+                domains = [d.strip() for d in domains] # Remove whitespace
         except FileNotFoundError:
             print(f"Error: {args.file} not found.")
             print("**FINAL OUTPUT**")
@@ -87,22 +1507,179 @@ def main():
         print("**FINAL OUTPUT**")
         return
 
-    # 2. Parallel lookups with rate limiting
-    domain_queue = queue.Queue()
-    for domain in domains:
-        domain_queue.put(domain)
+    # 2. Checkpoint journal, and on --resume skip what it says is finished
+    journal_path = args.journal or (f"{args.output}.journal" if args.output else None)
+    finished = set()
+    records = None if args.stream else {}  # Only the rebuilt non-stream output needs the old records
+    if args.resume:
+        if not journal_path:
+            print("Error: --resume needs --output or --journal to find the checkpoint.")
+            print("**FINAL OUTPUT**")
+            return
+        finished = load_journal(journal_path, records)
+        if finished:
+            print(f"Resuming: {len(finished)} domains already finished in {journal_path}", file=sys.stderr)
+            domains = skip_finished(domains, finished)
+        else:
+            print(f"No checkpoint at {journal_path}; starting from the beginning", file=sys.stderr)
+    resume = bool(finished)
+    resumed = list(records.values()) if records else []
+    journal = None
 
-    results = []
-    num_threads = 10  # Adjust as needed
-    
-    for _ in range(num_threads):
-        thread = threading.Thread(target=lookup_registrar, args=(domain_queue, results))
-        thread.daemon = True  # Daemonize thread
-        thread.start()
+    # 3. Where results go: straight to the writer with --stream, otherwise into a list
+    writer = None
+    out_file = None
+    if args.stream:
+        if args.output:
+            try:
+                append = resume and os.path.exists(args.output)
+                if append:
+                    # Rows for domains about to be retried would otherwise appear twice
+                    dropped = keep_finished_rows(args.output, args.format, finished)
+                    if dropped:
+                        print(f"Removed {dropped} error or unconfirmed rows from {args.output} to look up again",
+                              file=sys.stderr)
+                header = not (append and os.path.getsize(args.output))
+                out_file = open(args.output, 'a' if append else 'w', newline='')
+            except Exception as e:
+                print(f"Error writing to {args.output}: {e}")
+                print("**FINAL OUTPUT**")
+                return
+        else:
+            header = True
+            print("**FINAL OUTPUT**", file=sys.stderr)  # stdout carries only the records
+        if journal_path:
+            journal = Journal(journal_path, resume=resume)
+        fields = ['domain', 'registrar'] + (DETAIL_FIELDS if args.details else [])
+        writer = ResultWriter(out_file or sys.stdout, args.format, header=header, journal=journal, fields=fields)
+        results = writer
+    else:
+        results = list(resumed)
+        if journal_path:
+            journal = Journal(journal_path, results, resume=resume)
+            results = journal
+
+    # 4. Normalize and deduplicate: one lookup per registrable domain, fanned out to every row
+    sink = results
+    dedup = None
+    if not args.no_dedup:
+        try:
+            dedup = Deduplicator(results.append, SuffixTrie.from_file())
+        except OSError as e:
+            print(f"Warning: can't read {PSL_PATH} ({e}); looking up names as given", file=sys.stderr)
+        else:
+            domains = dedup.feed(domains)
+            sink = dedup
+
+    # 5. Answer what we can from the cache
+    cache = None
+    if args.cache or args.cache_only or args.refresh:
+        cache = WhoisCache(args.cache_file, args.cache_ttl, args.negative_ttl)
+        if not args.refresh:
+            domains = filter_cached(domains, cache, sink.append, args.cache_only, args.details)
+
+    # 6. Parallel lookups with per-server rate limiting
+    server = parse_server(args.whois_server) if args.whois_server else None
+    domain_queue = ServerScheduler(args.rate, args.burst, server_rates,
+                                   key=(lambda d: server[0]) if server else server_key,
+                                   maxsize=args.window if args.stream else 0)
+
+    directory = addresses = timings = None
+    if args.engine == 'async':
+        servers_file = args.servers_file or (DEFAULT_SERVERS_PATH if cache is not None else None)
+        directory = ServerDirectory(servers_file)
+        addresses = AddressCache()
+        timings = HopTimings() if args.timings else None
 
-    domain_queue.join()  # Wait for all domains to be processed
+    if args.engine == 'async':
+        max_workers = args.max_workers or args.concurrency
+    else:
+        max_workers = args.max_workers or DEFAULT_MAX_WORKERS
+    controller = ConcurrencyController(max(1, max_workers), adaptive=not args.no_adaptive)
+    started = time.perf_counter()
+
+    interrupted = False
+    try:
+        if args.engine == 'async':
+            asyncio.run(run_async_lookups(domains, args.concurrency, server, args.timeout, cache=cache,
+                                          scheduler=domain_queue, rate_limit_pause=args.rate_limit_pause,
+                                          on_result=sink.append, details=args.details,
+                                          directory=directory, addresses=addresses, timings=timings,
+                                          controller=controller))
+        else:
+            # One thread per possible slot; the controller decides how many may run at once
+            attempts = {}
+            throttled = {}
+            threads = []
+            for _ in range(controller.maximum):
+                thread = threading.Thread(target=lookup_registrar, args=(domain_queue, sink, cache, args.rate_limit_pause,
+                                                                          args.details, args.full_parse, controller, attempts),
+                                          kwargs={'throttled': throttled})
+                thread.daemon = True  # Daemonize thread so Ctrl-C doesn't wait for it
+                thread.start()
+                threads.append(thread)
+
+            # Workers are already running, so with --stream this blocks once the window is full
+            for domain in domains:
+                domain_queue.put(domain)
+            domain_queue.close()
+
+            for thread in threads:
+                thread.join()  # Each exits when the scheduler hands it the DONE sentinel
+    except KeyboardInterrupt:
+        interrupted = True
+    elapsed = time.perf_counter() - started
+
+    # Everything finished so far reaches the output and the journal, even after Ctrl-C
+    if writer is not None:
+        writer.close()
+        total = writer.count
+        if out_file is not None:
+            out_file.close()
+    else:
+        total = len(results) - len(resumed)
+    if domain_file is not None:
+        domain_file.close()
+    if journal is not None:
+        journal.close()
+    if directory is not None:
+        try:
+            directory.save()
+        except OSError as e:
+            print(f"Warning: can't save {directory.path}: {e}", file=sys.stderr)
+    if timings is not None:
+        print("\n".join(timings.report(addresses)), file=sys.stderr)
+    if controller.queries:
+        print(controller.report(elapsed), file=sys.stderr)
+    if interrupted:
+        if cache is not None:
+            cache.close()
+        print(f"Interrupted after {total} results." +
+              (f" Rerun with --resume to continue from {journal_path}." if journal is not None else ""), file=sys.stderr)
+        return
+
+    if dedup is not None and dedup.rows:
+        print(f"Normalized {dedup.rows} input rows to {dedup.lookups} registrable domains: "
+              f"{dedup.saved} lookups saved ({100.0 * dedup.saved / dedup.rows:.1f}%)"
+              + (f", {dedup.invalid} invalid" if dedup.invalid else ""), file=sys.stderr)
+    if cache is not None:
+        cache.close()
+        queried = dedup.lookups if dedup is not None else total
+        hit_rate = 100.0 * cache.hits / queried if queried else 0.0
+        lookups = 0 if args.cache_only else queried - cache.hits
+        print(f"Cache: {cache.hits} of {queried} domains answered from cache ({hit_rate:.1f}% hit rate), "
+              f"{lookups} network lookups made, {cache.hits} saved", file=sys.stderr)
+
+    if writer is not None:
+        if journal is not None:
+            os.remove(journal_path)  # Run complete; nothing left to resume
+        if args.output:
+            print("**FINAL OUTPUT**")
+            print(f"{total} results saved to {args.output}" + (f" ({len(finished)} from the earlier run)" if resume else ""))
+        return
 
-    # 3. Output results
+    # 7. Output results
+    results = list(results)
     df_results = pd.DataFrame(results)
 
     if args.format == 'csv':
@@ -110,9 +1687,7 @@ def main():
     elif args.format == 'json':
         output = df_results.to_json(orient='records')
     else:  # text
-        output = ""
-        for _, row in df_results.iterrows():
-            output += f"Domain: {row['domain']}, Registrar: {row['registrar']}\n"
+        output = "".join(format_text(row) + "\n" for row in results)
 
     print("**FINAL OUTPUT**")
     if args.output:
@@ -120,10 +1695,14 @@ def main():
             with open(args.output, 'w') as f:
                 f.write(output)
             print(f"Results saved to {args.output}")
+            if journal is not None:
+                os.remove(journal_path)  # Run complete; nothing left to resume
         except Exception as e:
             print(f"Error writing to {args.output}: {e}")
     else:
         print(output)
+        if journal is not None:
+            os.remove(journal_path)
 
 
 if __name__ == "__main__":